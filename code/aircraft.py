@@ -11,7 +11,7 @@ class AircraftDistributed(object):
 
     def __init__(self, my_map, start, goal, heuristics, agent_id):
         """
-        my_map   - list of lists specifying obstacle positions
+        my_map   - compiled Grid of the map (see grid.py)
         starts      - (x1, y1) start location
         goals       - (x1, y1) goal location
         heuristics  - heuristic to goal location
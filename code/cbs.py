@@ -1,7 +1,19 @@
 import time as timer
 import heapq
+import math
+import os
 import random
-from single_agent_planner import computeHeuristics, a_star, getLocation, getSumOfCost, pushNode
+from concurrent.futures import ProcessPoolExecutor
+from cbs_heuristics import HighLevelHeuristic
+from grid import Grid
+from heuristics import getDistanceFields
+from mdd import MDDCache, classifyConflict, constraintKey
+from meta_agent import TimeLimitExceeded, jointAStar
+from path_cache import PathCache
+from persistent import ConstraintChain, SharedPaths
+from sipp import sipp
+from symmetry import SymmetryReasoner
+from single_agent_planner import a_star, getLocation, getSumOfCost
 
 
 def detectCollision(path1, path2):
@@ -28,21 +40,70 @@ def detectCollisions(paths):
     # Return a list of first collisions between all robot pairs.
     #           A collision can be represented as dictionary that contains the id of the two robots, the vertex or edge
     #           causing the collision, and the timestep at which the collision occurred.
-    #           You should use your detect_collision function to find a collision between two robots.
+    #           The paths are hashed in a single pass: a (timestep, location) occupancy table, a table of the moves
+    #           (timestep, from, to) to find swaps and a table of the goals where agents stay after their path ends.
+    #           The result is the same as comparing every pair of paths with detect_collision.
+    occupancy = dict()
+    moves = dict()
+    parked = dict()
+    for i, path in enumerate(paths):
+        parked.setdefault(path[-1], []).append((i, len(path) - 1))
+
+    # first collision found for each pair of agents: (i, j) -> (timestep, location)
+    first_collisions = dict()
+    def addCollision(i, j, t, location):
+        if i > j:
+            i, j = j, i
+            location = location[::-1]
+        if (i, j) not in first_collisions or t < first_collisions[(i, j)][0]:
+            first_collisions[(i, j)] = (t, location)
+
+    for i, path in enumerate(paths):
+        for t, loc in enumerate(path):
+            # vertex collisions with the agents which are at the same location at the same time
+            for j in occupancy.get((t, loc), ()):
+                addCollision(j, i, t, [loc])
+            occupancy.setdefault((t, loc), []).append(i)
+            # vertex collisions with the agents which already stay at their goal at this location
+            for j, arrival in parked.get(loc, ()):
+                if arrival < t:
+                    addCollision(i, j, t, [loc])
+            # edge collisions with the agents which perform the opposite move at the same time
+            if t > 0 and path[t - 1] != loc:
+                for j in moves.get((t, loc, path[t - 1]), ()):
+                    addCollision(j, i, t, [path[t - 1], loc])
+                moves.setdefault((t, path[t - 1], loc), []).append(i)
+
     collisions = []
-    # for each path
-    for i in range(len(paths)):
-        # compare path with subsequent paths
-        for j in range(i+1,len(paths)):
-            # if collsion is detected
-            if detectCollision(paths[i], paths[j]) != None:
-                location, t = detectCollision(paths[i], paths[j])
-                # append collision
-                collisions.append({'a1': i, 'a2': j, 'loc': location, 'timestep': t})
+    for (i, j) in sorted(first_collisions):
+        t, location = first_collisions[(i, j)]
+        collisions.append({'a1': i, 'a2': j, 'loc': location, 'timestep': t})
      
     return collisions
 
 
+def updateCollisions(conflicts, paths, agent):
+    ##############################
+    # Return the pairwise collisions after the path of one agent was replanned
+    #           conflicts is the dictionary {(i, j): collision} (i < j) of the parent node. Only the pairs
+    #           involving the replanned agent are re-evaluated, the other pairs are inherited as they are.
+    new_conflicts = {pair: collision for pair, collision in conflicts.items() if agent not in pair}
+    for other in range(len(paths)):
+        if other == agent:
+            continue
+        i, j = min(agent, other), max(agent, other)
+        collision = detectCollision(paths[i], paths[j])
+        if collision is not None:
+            location, t = collision
+            new_conflicts[(i, j)] = {'a1': i, 'a2': j, 'loc': location, 'timestep': t}
+    return new_conflicts
+
+
+def collisionList(conflicts):
+    # the collisions of a node, ordered by agent pair as returned by detectCollisions
+    return [conflicts[pair] for pair in sorted(conflicts)]
+
+
 def standardSplitting(collision):
     ##############################
     #  Return a list of (two) constraints to resolve the given collision
@@ -81,37 +142,168 @@ def disjointSplitting(collision):
     #                          specified timestep, and the second constraint prevents the same agent to traverse the
     #                          specified edge at the specified timestep
     #           Choose the agent randomly
+    #{'a1': i, 'a2': j, 'loc': location, 'timestep': t}
+    constraints = []
+
+    # the location of an edge collision is the move of the second agent, it is flipped for the first agent
+    if random.randint(0, 1) == 0:
+        agent = collision['a1']
+        loc = collision['loc'][::-1]
+    else:
+        agent = collision['a2']
+        loc = collision['loc']
+
+    # positive constraint: the agent has to be at the location (or traverse the edge) at the timestep
+    constraints.append({'agent': agent,'loc': loc,'timestep': collision['timestep'],'positive': True})
+    # negative constraint: the agent is not allowed to be at the location (or traverse the edge) at the timestep
+    constraints.append({'agent': agent,'loc': loc,'timestep': collision['timestep'],'positive': False})
+
+    return constraints
+
+
+def pathsViolateConstraint(constraint, paths):
+    ##############################
+    # Return the list of agents whose paths violate the given positive constraint
+    #           A positive vertex constraint forbids all the other agents to be at the location at the timestep.
+    #           A positive edge constraint forbids all the other agents to be at either end of the edge when the
+    #           constrained agent is there, or to traverse the edge in the opposite direction.
+    agents = []
+    t = constraint['timestep']
+    for i in range(len(paths)):
+        if i == constraint['agent']:
+            continue
+        curr = getLocation(paths[i], t)
+        # vertex constraint
+        if len(constraint['loc']) == 1:
+            if curr == constraint['loc'][0]:
+                agents.append(i)
+        # edge constraint
+        else:
+            prev = getLocation(paths[i], t - 1)
+            if prev == constraint['loc'][0] or curr == constraint['loc'][1] \
+               or (prev == constraint['loc'][1] and curr == constraint['loc'][0]):
+                agents.append(i)
+    return agents
+
+
+def cacheEntry(members, constraints):
+    ##############################
+    # Return the agent and the constraints the paths of a (meta-)agent are cached under
+    #           A single agent is cached under its id and its constraints, a meta-agent under the tuple of its agents
+    #           and the constraints of all its agents.
+    if len(members) == 1:
+        return members[0], constraints[0]
+    return members, [constraint for agent_constraints in constraints for constraint in agent_constraints]
+
+
+def groupPaths(members, planned):
+    ##############################
+    # Return the paths {agent: path} of a (meta-)agent planned by CBSSolver.planGroup, None if it has no paths
+    if planned is None:
+        return None
+    if len(members) == 1:
+        return {members[0]: planned}
+    return dict(zip(members, planned))
+
+
+# solver of a worker process of the parallel CBS, it plans the (meta-)agents of the solver which started the process
+WORKER_SOLVER = None
+
+
+def initWorker(my_map, starts, goals, options):
+    ##############################
+    # Create the solver of a worker process, the map, the heuristics and the options are set up once per process
+    global WORKER_SOLVER
+    options = dict(options)
+    disjoint = options.pop('disjoint')
+    WORKER_SOLVER = CBSSolver(my_map, starts, goals, **options)
+    WORKER_SOLVER.disjoint = disjoint
 
-    pass
+
+def planInWorker(members, constraints, deadline):
+    ##############################
+    # Return the path of an agent, or the paths of a meta-agent, planned in a worker process (see CBSSolver.planGroup)
+    #           The meta-agents are planned within the time limit of the solver which started the process, the
+    #           TimeLimitExceeded of a search aborted at the deadline is raised again by the result of the future
+    WORKER_SOLVER.deadline = deadline
+    return WORKER_SOLVER.planGroup(members, constraints)
 
 
 class CBSSolver(object):
     """The high-level search of CBS."""
 
-    def __init__(self, my_map, starts, goals):
+    def __init__(self, my_map, starts, goals, low_level='astar', prioritize_conflicts=False, heuristic='none',
+                 symmetry_reasoning=False, merge_threshold=None, merge_policy='joint', workers=1):
         """my_map   - list of lists specifying obstacle positions
         starts      - [(x1, y1), (x2, y2), ...] list of start locations
         goals       - [(x1, y1), (x2, y2), ...] list of goal locations
+        low_level   - the low-level search, 'astar' (time-expanded A*) or 'sipp' (Safe Interval Path Planning)
+        prioritize_conflicts - split on cardinal conflicts first, then on semi-cardinal ones (classified with MDDs)
+        heuristic   - admissible h-value of the high-level nodes: 'none', 'CG' (conflict graph), 'DG' (dependency graph)
+                      or 'WDG' (weighted dependency graph), the nodes are expanded in order of cost + h
+        symmetry_reasoning - resolve target, corridor and rectangle conflicts with length and target, range and
+                      barrier constraints in one split
+        merge_threshold - merge two (meta-)agents into a meta-agent once they collided more than this number of times
+                      along a branch (MA-CBS), None to never merge
+        merge_policy - the low-level search of the meta-agents, 'joint' (A* over the combined states of the agents)
+                      or 'cbs' (a nested CBS on the agents of the meta-agent)
+        workers     - number of processes planning the children in parallel, the best workers nodes of the open list
+                      are expanded at once (1 to expand one node at a time, None for the number of processors)
         """
 
         self.my_map = my_map
+        # compiled version of the map, shared by all the low-level searches
+        self.grid = Grid(my_map)
         self.starts = starts
         self.goals = goals
         self.num_of_agents = len(goals)
+        # both low-level searches take the same arguments and return shortest paths of the same cost (but not
+        # always the same paths, so the solvers can differ in the ties they break)
+        self.low_level = sipp if low_level == 'sipp' else a_star
 
         self.num_of_generated = 0
         self.num_of_expanded = 0
         self.CPU_time = 0
+        # the search stops after time_limit seconds, the searches of the meta-agents stop at the deadline as well
+        self.time_limit = 30
+        self.deadline = math.inf
 
         self.open_list = []
 
         # compute heuristics for the low-level search
-        self.heuristics = []
-        for goal in self.goals:
-            self.heuristics.append(computeHeuristics(my_map, goal))
+        # the distance fields are shared with the other solvers through the heuristics cache
+        self.heuristics = getDistanceFields(self.grid, self.goals)
+        # the heuristics indexed by cell id, converted once for all the low-level searches
+        self.h_cells = [self.grid.cellValues(h_values) for h_values in self.heuristics]
+        # low-level paths shared by the nodes which give an agent the same constraints
+        self.path_cache = PathCache()
+
+        # MDDs of the agents, used to classify the conflicts
+        self.prioritize_conflicts = prioritize_conflicts
+        self.mdd_cache = MDDCache(self.grid, self.starts, self.goals, self.h_cells)
+        # lower bounds on the extra cost of the solutions of the high-level nodes
+        self.high_level_heuristic = None if heuristic == 'none' else HighLevelHeuristic(self, heuristic)
+        # detects the target, corridor and rectangle conflicts
+        self.symmetry_reasoner = SymmetryReasoner(self.grid, self.starts, self.goals) if symmetry_reasoning else None
+
+        # meta-agent merging, the nested CBS of a meta-agent uses the same options (without merging)
+        self.merge_threshold = merge_threshold
+        self.merge_policy = merge_policy
+        self.nested_options = {'low_level': low_level, 'prioritize_conflicts': prioritize_conflicts,
+                               'heuristic': heuristic, 'symmetry_reasoning': symmetry_reasoning}
+        self.num_of_merges = 0
+
+        # the constraint sets of the generated nodes, a child with the same constraints as an earlier node is pruned
+        self.generated_nodes = set()
+        self.num_of_duplicates = 0
+
+        # parallel CBS, the worker processes are only started once children have to be planned in parallel
+        self.workers = os.cpu_count() if workers is None else workers
+        self.executor = None
 
     def pushNode(self, node):
-        heapq.heappush(self.open_list, (node['cost'], len(node['collisions']), self.num_of_generated, node))
+        # nodes are ordered by cost + h, ties are broken by the number of conflicting agent pairs
+        heapq.heappush(self.open_list, (node['cost'] + node['h'], len(node['conflicts']), self.num_of_generated, node))
         #print("Generate node {}".format(self.num_of_generated))
         self.num_of_generated += 1
 
@@ -121,33 +313,50 @@ class CBSSolver(object):
         self.num_of_expanded += 1
         return node
 
-    def findSolution(self, disjoint=True):
+    def findSolution(self, disjoint=True, constraints=()):
         """ Finds paths for all agents from their start locations to their goal locations
 
         disjoint    - use disjoint splitting or not
+        constraints - constraints of the root node (used by the nested CBS of a meta-agent)
         """
 
         self.start_time = timer.time()
+        self.deadline = self.start_time + self.time_limit
+        self.disjoint = disjoint
 
         # Generate the root node
-        # constraints   - list of constraints
-        # paths         - list of paths, one for each agent
+        # constraints   - list of constraints, shared with the children as a ConstraintChain
+        # paths         - list of paths, one for each agent, shared with the children as SharedPaths
         #               [[(x11, y11), (x12, y12), ...], [(x21, y21), (x22, y22), ...], ...]
         # collisions     - list of collisions in paths
+        # conflicts     - the same collisions indexed by agent pair {(i, j): collision}, inherited by the children
+        # h             - lower bound on the extra cost needed to solve the collisions
+        # meta_agents   - for each agent, the sorted tuple of the agents of its meta-agent (only itself until it is merged)
+        # conflict_counts - number of times each agent pair (i, j) (i < j) was split on along the branch
         root = {'cost': 0,
-                'constraints': [],
+                'h': 0,
+                'constraints': ConstraintChain(),
                 'paths': [],
-                'collisions': []}
+                'collisions': [],
+                'conflicts': {},
+                'meta_agents': [(i,) for i in range(self.num_of_agents)],
+                'conflict_counts': {}}
+        for constraint in constraints:
+            root['constraints'] = root['constraints'].add(constraint)
         for i in range(self.num_of_agents):  # Find initial path for each agent
-            path = a_star(self.my_map, self.starts[i], self.goals[i], self.heuristics[i],
-                          i, root['constraints'])
+            path = self.findPath(root, i)
             if path is None:
                 raise BaseException('No solutions')
             root['paths'].append(path)
 
+        root['paths'] = SharedPaths(root['paths'])
         root['cost'] = getSumOfCost(root['paths'])
         root['collisions'] = detectCollisions(root['paths'])
+        root['conflicts'] = {(collision['a1'], collision['a2']): collision for collision in root['collisions']}
+        root['h'] = self.computeH(root)
         
+        self.generated_nodes = set()
+        self.isNewNode(root)
         self.pushNode(root)
 
         '''# Task 3.1: Testing
@@ -166,63 +375,390 @@ class CBSSolver(object):
         #                standard_splitting function). Add a new child node to your open list for each constraint
         #           Ensure to create a copy of any objects that your child nodes might inherit
         self.CPU_time = 0
-        while len(self.open_list) > 0 and self.CPU_time< 30:
-            self.CPU_time = timer.time() - self.start_time 
-            # get next node with smallest cost
-            P = self.popNode()  
-            # if node has no collisions, return paths         
-            if len(P['collisions']) == 0:
-                self.CPU_time = timer.time() - self.start_time
-                # print the results
-                # self.print_results(root)
-                return P['paths'], self.CPU_time
-
-            # convert collision to list of two constraints         
-            collision = P['collisions'][0]  
-            constraints = standardSplitting(collision)          
-            
-            # for each constraint option, create new child
-            for constraint in constraints:
-                # child inherets neccessary properties
-                new_list = P['constraints'].copy()
-                new_list.append(constraint)
-            
-                Q = {'cost': 0,
-                'constraints': new_list,
-                'paths': P['paths'].copy(),
-                'collisions': []}
-                ai = constraint['agent']
-                
-                # create path for child including new constraint 
-                         
-                path = a_star(self.my_map, self.starts[ai], self.goals[ai], self.heuristics[ai],
-                          ai, Q['constraints'])
-                   
-                
-                if path != None:
-                                        
-                    Q['paths'][ai] = path                                      
-                    Q['collisions'] = detectCollisions(Q['paths'])                                       
-                    Q['cost'] = getSumOfCost(Q['paths'])
-                    
-                    
+        try:
+            while len(self.open_list) > 0 and self.CPU_time< self.time_limit:
+                self.CPU_time = timer.time() - self.start_time 
+                # get next node with smallest cost
+                P = self.popNode()  
+                # if node has no collisions, return paths         
+                if len(P['collisions']) == 0:
+                    self.CPU_time = timer.time() - self.start_time
+                    # print the results
+                    # self.print_results(root)
+                    return P['paths'].toList(), self.CPU_time
+
+                # parallel CBS: the next best nodes are expanded at the same time. A node without collisions stays in
+                # the open list until it is the best node, so the solution remains optimal
+                batch = [P]
+                while len(batch) < self.workers and len(self.open_list) > 0 and len(self.open_list[0][-1]['collisions']) > 0:
+                    batch.append(self.popNode())
+
+                # for each constraint option (or merge), create new child
+                children = [child for P in batch for child in self.expandNode(P)]
+                for Q in self.generateChildren(children):
                     self.pushNode(Q)
-                    
-            #i +=1
-        if self.CPU_time > 30:
+                        
+                #i +=1
+        except TimeLimitExceeded:
+            # the search of a meta-agent was aborted at the deadline
+            self.CPU_time = timer.time() - self.start_time
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+        if self.CPU_time > self.time_limit:
             print("TIME LIMIT HIT")
             # raise Exception("TIME LIMIT")
             return [], 0
-            
 
+        # the open list is exhausted: the agents cannot all reach their goals under the root constraints
         # self.print_results(root)
-        return root, self.CPU_time
+        return [], 0
         
 
 
+    def splitCollision(self, collision, P, disjoint):
+        """ Returns the constraints of the children resolving the collision: the constraints of a target, corridor
+            or rectangle conflict, otherwise the constraints of disjoint or standard splitting
+
+        collision   - the collision to resolve
+        P           - the node to expand
+        disjoint    - use disjoint splitting or not
+        """
+        if self.symmetry_reasoner is not None:
+            constraints = self.symmetry_reasoner.symmetryConstraints(collision, P['paths'])
+            if constraints is not None:
+                return constraints
+        if disjoint:
+            return disjointSplitting(collision)
+        return standardSplitting(collision)
+
+
+    def chooseCollision(self, P):
+        """ Returns the collision of node P to split on: the first cardinal collision, otherwise the first
+            semi-cardinal collision, otherwise the first collision
+
+        P           - the node to expand
+        """
+        if not self.prioritize_conflicts:
+            return P['collisions'][0]
+
+        semi_cardinal = None
+        for collision in P['collisions']:
+            mdds = [self.mdd_cache.getMDD(agent, P['constraints'].forAgent(agent), len(P['paths'][agent]) - 1)
+                    for agent in (collision['a1'], collision['a2'])]
+            kind = classifyConflict(collision, mdds[0], mdds[1])
+            if kind == 'cardinal':
+                return collision
+            elif kind == 'semi-cardinal' and semi_cardinal is None:
+                semi_cardinal = collision
+
+        if semi_cardinal is not None:
+            return semi_cardinal
+        return P['collisions'][0]
+
+
+    def expandNode(self, P):
+        """ Returns the children of node P as (child, groups) pairs: the child with its new constraints (or merged
+            meta-agents) but still with the paths of P, and the meta-agents which have to be replanned in it.
+            The children with the same constraints as an earlier node are left out
+
+        P           - the node to expand
+        """
+        # convert collision to list of two constraints
+        collision = self.chooseCollision(P)
+
+        # MA-CBS: the collision is counted along the branch, the (meta-)agents which collided too often are merged
+        # into a meta-agent and planned jointly in a single child instead of being split on again
+        children = []
+        if self.merge_threshold is not None:
+            P = self.countCollision(P, collision)
+            if self.metaConflictCount(P, collision) > self.merge_threshold:
+                children.append(self.prepareMerge(P, collision))
+        if len(children) == 0:
+            children = [self.prepareChild(P, constraint) for constraint in self.splitCollision(collision, P, self.disjoint)]
+        return [(Q, groups) for Q, groups in children if self.isNewNode(Q)]
+
+
+    def generateChildren(self, children):
+        """ Replans the meta-agents of the children and returns the children which have a solution, see expandNode
+            With several workers, the meta-agents of all the children are planned in parallel
+
+        children    - list of (child, groups) pairs as returned by expandNode
+        """
+        jobs = [(Q, members) for Q, groups in children for members in groups]
+        results = iter(self.planGroups(jobs))
+        generated = []
+        for Q, groups in children:
+            # all the results of the child are consumed, also once one of its meta-agents has no path
+            new_paths = [next(results) for _ in groups]
+            if any(paths is None for paths in new_paths):
+                continue
+            for paths in new_paths:
+                self.updatePaths(Q, paths)
+            Q = self.finishChild(Q)
+            if Q is not None:
+                generated.append(Q)
+        return generated
+
+
+    def prepareChild(self, P, constraint):
+        """ Returns the child of node P with one more constraint and the meta-agents to replan in it
+            A positive constraint also constrains the other agents, the ones whose paths violate it are replanned as well
+
+        P           - the parent node
+        constraint  - the constraint added in the child
+        """
+        # child inherets neccessary properties
+        # the constraints and paths of the parent are shared, the child only stores the new constraint and path
+        Q = P.copy()
+        Q['constraints'] = P['constraints'].add(constraint)
+        ai = constraint['agent']
+        replanned = [ai]
+        if constraint.get('positive', False):
+            replanned += pathsViolateConstraint(constraint, P['paths'])
+
+        # the agents of a meta-agent are replanned together
+        groups = []
+        for agent in replanned:
+            members = self.metaAgent(Q, agent)
+            if members not in groups:
+                groups.append(members)
+        return Q, groups
+
+
+    def generateChild(self, P, constraint):
+        """ Creates the child of node P with one more constraint, None if one of the replanned agents has no path
+            (or if the heuristic proves that the child has no solution)
+            The agents are replanned one after the other, each one sees the paths already replanned in the child
+
+        P           - the parent node
+        constraint  - the constraint added in the child
+        """
+        Q, groups = self.prepareChild(P, constraint)
+        for members in groups:
+            # create path for child including new constraint 
+            new_paths = self.replanAgent(Q, members[0])
+            if new_paths is None:
+                return None
+            self.updatePaths(Q, new_paths)
+        return self.finishChild(Q)
+
+
+    def finishChild(self, Q):
+        """ Returns the child once its agents are replanned, with its collisions and h-value, None if the heuristic
+            proves that it has no solution
+        """
+        Q['collisions'] = collisionList(Q['conflicts'])
+        Q['h'] = self.computeH(Q)
+        # some of the agents cannot be solved together under the constraints of the child
+        if Q['h'] == math.inf:
+            return None
+        return Q
+
+
+    def countCollision(self, P, collision):
+        """ Returns a copy of node P in which the collision is counted, the children of the copy inherit the counts
+
+        P           - the node to expand
+        collision   - the collision split on
+        """
+        P = P.copy()
+        pair = (collision['a1'], collision['a2'])
+        # the counts of the parent are shared with its other children, so they are replaced instead of modified
+        P['conflict_counts'] = P['conflict_counts'].copy()
+        P['conflict_counts'][pair] = P['conflict_counts'].get(pair, 0) + 1
+        return P
+
+
+    def metaConflictCount(self, node, collision):
+        """ Returns the number of collisions along the branch between the meta-agents of the two colliding agents """
+        meta1, meta2 = node['meta_agents'][collision['a1']], node['meta_agents'][collision['a2']]
+        return sum(node['conflict_counts'].get((min(i, j), max(i, j)), 0) for i in meta1 for j in meta2)
+
+
+    def prepareMerge(self, P, collision):
+        """ Returns the child of node P in which the meta-agents of the two colliding agents are merged, and the
+            merged meta-agent, which is planned jointly under the constraints of its agents
+
+        P           - the parent node
+        collision   - the collision between the two meta-agents
+        """
+        members = tuple(sorted(P['meta_agents'][collision['a1']] + P['meta_agents'][collision['a2']]))
+        Q = P.copy()
+        Q['meta_agents'] = P['meta_agents'].copy()
+        for agent in members:
+            Q['meta_agents'][agent] = members
+        self.num_of_merges += 1
+        return Q, [members]
+
+
+    def updatePaths(self, node, new_paths):
+        """ Replaces the paths of the replanned agents in the node and updates its cost and collisions
+
+        node        - the node the agents are replanned in
+        new_paths   - {agent: path} of the replanned agents
+        """
+        for agent, path in new_paths.items():
+            node['cost'] += len(path) - len(node['paths'][agent])
+            node['paths'] = node['paths'].replace(agent, path)
+            # only the collisions of the replanned agent can have changed
+            node['conflicts'] = updateCollisions(node['conflicts'], node['paths'], agent)
+
+
+    def metaAgent(self, node, agent):
+        """ Returns the agents of the meta-agent of the agent in the node, only the agent itself without merging """
+        return node['meta_agents'][agent] if self.merge_threshold is not None else (agent,)
+
+
+    def replanAgent(self, node, agent):
+        """ Returns the new paths {agent: path} of the agent and of the other agents of its meta-agent under the
+            constraints of the node, None if there are none
+
+        node        - the node the agent is replanned in
+        agent       - the agent id
+        """
+        members = self.metaAgent(node, agent)
+        if len(members) == 1:
+            return groupPaths(members, self.findPath(node, agent))
+        # the meta-agent is cached under the constraints of all its agents
+        constraints = [node['constraints'].forAgent(member) for member in members]
+        return groupPaths(members, self.path_cache.getPath(*cacheEntry(members, constraints),
+                                                           lambda: self.planGroup(members, constraints)))
+
+
+    def planGroups(self, jobs):
+        """ Returns the new paths {agent: path} of each (node, meta-agent) job, None for the jobs without paths
+            The jobs which are not in the path cache are planned in the worker processes if there are several workers
+
+        jobs        - list of (node, meta-agent) pairs
+        """
+        if self.workers == 1 or len(jobs) < 2:
+            return [self.replanAgent(Q, members[0]) for Q, members in jobs]
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker,
+                                                initargs=(self.my_map, self.starts, self.goals, self.workerOptions()))
+        planned = []
+        futures = dict()
+        for Q, members in jobs:
+            constraints = [Q['constraints'].forAgent(member) for member in members]
+            agent, cached_constraints = cacheEntry(members, constraints)
+            found, paths = self.path_cache.lookup(agent, cached_constraints)
+            key = None
+            if not found:
+                # the same (meta-)agent under the same constraints is only planned once per batch
+                key = (agent, constraintKey(cached_constraints))
+                if key not in futures:
+                    futures[key] = (agent, cached_constraints, self.executor.submit(planInWorker, members, constraints, self.deadline))
+            planned.append((members, paths, key))
+
+        results = dict()
+        for key, (agent, cached_constraints, future) in futures.items():
+            results[key] = future.result()
+            self.path_cache.store(agent, cached_constraints, results[key])
+        return [groupPaths(members, paths if key is None else results[key]) for members, paths, key in planned]
+
+
+    def workerOptions(self):
+        """ Returns the options of the solvers of the worker processes, which plan the (meta-)agents of this solver """
+        options = dict(self.nested_options, merge_policy=self.merge_policy)
+        options['disjoint'] = self.disjoint
+        return options
+
+
+    def planGroup(self, members, constraints):
+        """ Returns the path of a single agent, or the paths of the agents of a meta-agent, under their constraints,
+            None if there are none. The path cache is not used
+
+        members     - the agents of the (meta-)agent
+        constraints - for each agent of the (meta-)agent, its constraints
+        """
+        if len(members) == 1:
+            agent = members[0]
+            return self.low_level(self.grid, self.starts[agent], self.goals[agent], self.h_cells[agent],
+                                  agent, constraints[0])
+        return self.planMetaAgent(members, constraints)
+
+
+    def planMetaAgent(self, members, constraints):
+        """ Returns the paths of the agents of a meta-agent found with the merge policy, None if there are none
+            Raises TimeLimitExceeded if the search is aborted at the deadline of the solver
+
+        members     - the agents of the meta-agent
+        constraints - for each agent of the meta-agent, its constraints
+        """
+        starts = [self.starts[agent] for agent in members]
+        goals = [self.goals[agent] for agent in members]
+        if self.merge_policy == 'joint':
+            return jointAStar(self.grid, starts, goals, [self.h_cells[agent] for agent in members], members, constraints,
+                              self.deadline)
+
+        # the meta-agent has no paths if one of its agents has none on its own (the root of the nested solver would fail)
+        for agent, agent_constraints in zip(members, constraints):
+            if self.path_cache.getPath(agent, agent_constraints, lambda: self.planGroup((agent,), [agent_constraints])) is None:
+                return None
+
+        # nested CBS: the constraints are renumbered to the agents of the nested solver, the positive constraints of
+        # the other agents (which constrain the agents of the meta-agent as well) belong to none of them
+        local = {agent: i for i, agent in enumerate(members)}
+        nested_constraints = dict()
+        for agent_constraints in constraints:
+            for constraint in agent_constraints:
+                nested_constraints[id(constraint)] = dict(constraint, agent=local.get(constraint['agent'], -1))
+        nested = CBSSolver(self.my_map, starts, goals, **self.nested_options)
+        # the nested search only gets the time left to this solver
+        nested.time_limit = max(0, self.deadline - timer.time())
+        paths, _ = nested.findSolution(self.disjoint, list(nested_constraints.values()))
+        # the solver returns an empty list if it does not find a solution, which only proves that there is none if it
+        # did not run out of time (its time limit ends at the deadline of this solver)
+        if len(paths) != len(members):
+            if timer.time() > self.deadline:
+                raise TimeLimitExceeded()
+            return None
+        return paths
+
+
+    def findPath(self, node, agent):
+        """ Returns the path of the agent under the constraints of the node, None if there is none
+
+        node        - the node the agent is replanned in
+        agent       - the agent id
+        """
+        constraints = node['constraints'].forAgent(agent)
+        return self.path_cache.getPath(agent, constraints, lambda: self.planGroup((agent,), [constraints]))
+
+
+    def isNewNode(self, node):
+        """ Returns True if no node with the same constraints (and meta-agents) was generated before, and records it
+            Two such nodes have the same solutions and, as each path is the shortest under the constraints of its
+            agent, the same cost, so only the first one is kept
+
+        node        - the generated node
+        """
+        key = constraintKey(node['constraints'])
+        if self.merge_threshold is not None:
+            key = (key, tuple(node['meta_agents']))
+        if key in self.generated_nodes:
+            self.num_of_duplicates += 1
+            return False
+        self.generated_nodes.add(key)
+        return True
+
+
+    def computeH(self, node):
+        """ Returns the h-value of the node, 0 if no high-level heuristic is used """
+        if self.high_level_heuristic is None:
+            return 0
+        return self.high_level_heuristic.computeH(node)
+
+
     def print_results(self, node):
         print("\n Found a solution! \n")
         print("CPU time (s):    {:.2f}".format(self.CPU_time))
         print("Sum of costs:    {}".format(getSumOfCost(node['paths'])))
         print("Expanded nodes:  {}".format(self.num_of_expanded))
         print("Generated nodes: {}".format(self.num_of_generated))
+        print("Duplicate nodes: {}".format(self.num_of_duplicates))
+        print("Path cache hits: {:.2f}".format(self.path_cache.hitRate()))
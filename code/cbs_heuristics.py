@@ -0,0 +1,241 @@
+"""
+This file contains the admissible heuristics of the high-level search of CBS, computed from the conflicts of a node:
+    CG  - conflict graph: minimum vertex cover of the graph of the agents with cardinal conflicts
+    DG  - dependency graph: minimum vertex cover of the graph of the agents whose MDDs cannot be combined without a conflict
+    WDG - weighted dependency graph: as DG, each edge weighted with the extra cost needed to solve the two agents together
+The h-value of a node is a lower bound on the extra cost of its best solution, so CBS remains optimal.
+"""
+
+import heapq
+import math
+from mdd import classifyConflict, constraintKey
+from single_agent_planner import getLocation
+
+# components of the (weighted) dependency graph up to this size are covered exactly, larger ones get a matching bound
+MAX_EXACT_COVER = 8
+
+
+def matchingBound(edges):
+    """ Returns a lower bound of the minimum weighted vertex cover: the weight of a greedy matching of the edges
+
+    Args:
+        edges (dict): {(i, j): weight}
+    """
+    matched = set()
+    bound = 0
+    for (i, j), weight in sorted(edges.items(), key=lambda item: -item[1]):
+        if i not in matched and j not in matched:
+            matched.update((i, j))
+            bound += weight
+    return bound
+
+
+def weightedVertexCover(edges):
+    """ Returns the minimum weighted vertex cover: the minimum sum of integer values x_i >= 0 of the vertices
+        such that x_i + x_j >= weight for every edge. With weights 1 this is the minimum vertex cover.
+
+    Args:
+        edges (dict): {(i, j): weight} with positive integer weights
+    """
+    neighbours = dict()
+    for (i, j), weight in edges.items():
+        neighbours.setdefault(i, []).append((j, weight))
+        neighbours.setdefault(j, []).append((i, weight))
+
+    # the connected components of the graph are covered independently
+    total = 0
+    visited = set()
+    for vertex in neighbours:
+        if vertex in visited:
+            continue
+        component = [vertex]
+        visited.add(vertex)
+        for v in component:
+            for u, _ in neighbours[v]:
+                if u not in visited:
+                    visited.add(u)
+                    component.append(u)
+        component_set = set(component)
+        component_edges = {pair: weight for pair, weight in edges.items() if pair[0] in component_set}
+
+        if len(component) > MAX_EXACT_COVER:
+            total += matchingBound(component_edges)
+        else:
+            total += exactCover(sorted(component, key=lambda v: -len(neighbours[v])), neighbours, component_edges)
+    return total
+
+
+def exactCover(vertices, neighbours, edges):
+    """ Branch and bound over the values of the vertices of a connected component, see weightedVertexCover
+
+    Args:
+        vertices (list): the vertices of the component, in the order in which they are assigned
+        neighbours (dict): vertex -> [(neighbour, weight)]
+        edges (dict): {(i, j): weight}, the edges of the component
+    """
+    # lower bound of the cost of the vertices which are not assigned yet (edges among them only)
+    suffix_bound = []
+    for k in range(len(vertices)):
+        remaining = set(vertices[k:])
+        suffix_bound.append(matchingBound({(i, j): w for (i, j), w in edges.items() if i in remaining and j in remaining}))
+    suffix_bound.append(0)
+
+    values = dict()
+    best = [sum(edges.values())]
+    def search(k, cost):
+        if cost + suffix_bound[k] >= best[0]:
+            return
+        if k == len(vertices):
+            best[0] = cost
+            return
+        v = vertices[k]
+        # the value of the vertex has to cover the rest of the weight of the edges to its assigned neighbours
+        low = max([weight - values[u] for u, weight in neighbours[v] if u in values] + [0])
+        high = max(weight for _, weight in neighbours[v])
+        for value in range(low, max(low, high) + 1):
+            values[v] = value
+            search(k + 1, cost + value)
+            del values[v]
+
+    search(0, 0)
+    return best[0]
+
+
+class HighLevelHeuristic(object):
+    """ Computes the h-value of the CBS nodes, the pairwise values are cached by the constraints of the two agents """
+
+    # maximum number of nodes expanded to solve the two agents of a WDG edge, the bound reached so far is used when it is hit
+    PAIR_NODE_LIMIT = 32
+
+    def __init__(self, solver, kind='CG'):
+        """
+        Args:
+            solver (CBSSolver): the solver whose nodes are evaluated (map, low-level search and MDDs)
+            kind (str, optional): 'CG', 'DG' or 'WDG'
+        """
+        self.solver = solver
+        self.kind = kind
+        self.pair_values = dict()
+
+
+    def computeH(self, node):
+        """ Returns the h-value of the node
+
+        Args:
+            node (dict): CBS node with 'paths', 'constraints' and 'collisions'
+        Returns math.inf if the node has no solution
+        """
+        edges = dict()
+        for collision in node['collisions']:
+            pair = (collision['a1'], collision['a2'])
+            # the agents of a meta-agent are planned jointly, the extra cost of their collisions is not bounded by
+            # their own MDDs, so these collisions are left out of the graph (which keeps the heuristic admissible)
+            if len(node['meta_agents'][pair[0]]) > 1 or len(node['meta_agents'][pair[1]]) > 1:
+                continue
+            weight = self.pairValue(node, collision)
+            # two agents which cannot be solved together make the node unsolvable
+            if weight == math.inf:
+                return math.inf
+            if weight > 0:
+                edges[pair] = weight
+        return weightedVertexCover(edges)
+
+
+    def pairValue(self, node, collision):
+        """ Returns the weight of the edge between the two colliding agents in the graph of the heuristic """
+        i, j = collision['a1'], collision['a2']
+        constraints = [node['constraints'].forAgent(agent) for agent in (i, j)]
+        costs = [len(node['paths'][agent]) - 1 for agent in (i, j)]
+        mdds = [self.solver.mdd_cache.getMDD(agent, agent_constraints, cost)
+                for agent, agent_constraints, cost in zip((i, j), constraints, costs)]
+
+        # a cardinal conflict always increases the cost by at least one
+        cardinal = classifyConflict(collision, mdds[0], mdds[1]) == 'cardinal'
+        if self.kind == 'CG':
+            return 1 if cardinal else 0
+
+        key = (i, j, costs[0], costs[1], constraintKey(constraints[0]), constraintKey(constraints[1]))
+        if key not in self.pair_values:
+            dependent = cardinal or not self.jointMDDExists(mdds[0], mdds[1])
+            if not dependent:
+                self.pair_values[key] = 0
+            elif self.kind == 'DG':
+                self.pair_values[key] = 1
+            else:
+                self.pair_values[key] = max(1, self.solvePair(node, i, j))
+        return self.pair_values[key]
+
+
+    def jointMDDExists(self, mdd1, mdd2):
+        """ Returns True if the two agents have paths in their MDDs which do not collide with each other """
+        grid = self.solver.grid
+        offsets, neighbours = grid.offsets, grid.neighbours
+        depth = max(len(mdd1), len(mdd2))
+        def level(mdd, t):
+            return mdd[t] if t < len(mdd) else mdd[-1]
+
+        # the pairs of cells the two agents can be in at the same timestep without having collided before
+        pairs = {(a, b) for a in level(mdd1, 0) for b in level(mdd2, 0) if a != b}
+        for t in range(1, depth):
+            next_level1, next_level2 = level(mdd1, t), level(mdd2, t)
+            next_pairs = set()
+            for a, b in pairs:
+                for next_a in neighbours[offsets[a]:offsets[a + 1]]:
+                    if next_a not in next_level1:
+                        continue
+                    for next_b in neighbours[offsets[b]:offsets[b + 1]]:
+                        # vertex collision or edge collision (the agents swap their cells)
+                        if next_b in next_level2 and next_a != next_b and not (next_a == b and next_b == a):
+                            next_pairs.add((next_a, next_b))
+            pairs = next_pairs
+            if len(pairs) == 0:
+                return False
+        return len(pairs) > 0
+
+
+    def solvePair(self, node, i, j):
+        """ Returns the extra cost needed to solve the two agents together under the constraints of the node,
+            found with a small CBS search which only considers the collisions of the two agents
+        """
+        solver = self.solver
+        base = len(node['paths'][i]) + len(node['paths'][j])
+        open_list = [(base, 0, node['constraints'], node['paths'][i], node['paths'][j])]
+        num_generated = 1
+        expanded = 0
+        while len(open_list) > 0:
+            cost, _, constraints, path_i, path_j = heapq.heappop(open_list)
+            collision = firstCollision(path_i, path_j)
+            # the pair is solved, or the search is stopped with a lower bound of the extra cost
+            if collision is None or expanded >= HighLevelHeuristic.PAIR_NODE_LIMIT:
+                return cost - base
+            expanded += 1
+
+            location, t = collision
+            # the same constraints as standard splitting: the location of an edge collision is the move of agent j
+            if len(location) == 1:
+                children = [(i, location), (j, location)]
+            else:
+                children = [(j, location), (i, location[::-1])]
+            for agent, loc in children:
+                child_constraints = constraints.add({'agent': agent, 'loc': loc, 'timestep': t})
+                path = solver.low_level(solver.grid, solver.starts[agent], solver.goals[agent], solver.h_cells[agent],
+                                        agent, child_constraints.forAgent(agent))
+                if path is None:
+                    continue
+                child_paths = (path, path_j) if agent == i else (path_i, path)
+                heapq.heappush(open_list, (len(child_paths[0]) + len(child_paths[1]), num_generated, child_constraints) + child_paths)
+                num_generated += 1
+
+        # the two agents cannot be solved together, so the node has no solution at all
+        return math.inf
+
+
+def firstCollision(path1, path2):
+    """ Returns the first (location, timestep) collision of the two paths, None if they do not collide """
+    for t in range(max(len(path1), len(path2))):
+        curr1, curr2 = getLocation(path1, t), getLocation(path2, t)
+        if curr1 == curr2:
+            return [curr1], t
+        if t > 0 and curr1 == getLocation(path2, t - 1) and curr2 == getLocation(path1, t - 1):
+            return [curr1, curr2], t
+    return None
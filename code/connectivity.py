@@ -0,0 +1,81 @@
+"""
+This file contains the connected components of the free cells of a map, some of which are blocked (e.g. by agents
+parked at their goals). Two locations are reachable from each other if they are in the same component.
+The components are labelled once and only the components around a cell are relabelled when it is blocked or freed.
+"""
+
+from grid import compileGrid
+
+
+class ComponentLabels(object):
+    """ Connected component label of every free cell of the map which is not blocked """
+
+    def __init__(self, my_map):
+        """
+        Args:
+            my_map (list or Grid): obstacle map (or its compiled Grid)
+        """
+        self.grid = compileGrid(my_map)
+        self.blocked = set()
+        # cell id -> label of its component, -1 for the blocked cells
+        self.labels = [-1] * self.grid.num_cells
+        self.next_label = 0
+        for cell in range(self.grid.num_cells):
+            if self.labels[cell] == -1:
+                self.fill(cell)
+
+
+    def fill(self, cell):
+        """ Gives a new label to the component of the cell, the old labels of its cells are overwritten """
+        offsets, neighbours = self.grid.offsets, self.grid.neighbours
+        label = self.next_label
+        self.next_label += 1
+        self.labels[cell] = label
+        stack = [cell]
+        while len(stack) > 0:
+            curr = stack.pop()
+            # the last neighbour of a cell is the cell itself (the wait move)
+            for i in range(offsets[curr], offsets[curr + 1] - 1):
+                next_cell = neighbours[i]
+                if self.labels[next_cell] != label and next_cell not in self.blocked:
+                    self.labels[next_cell] = label
+                    stack.append(next_cell)
+
+
+    def block(self, cell):
+        """ Blocks a cell, its component may split in up to four components, one around each neighbour """
+        offsets, neighbours = self.grid.offsets, self.grid.neighbours
+        old_label = self.labels[cell]
+        self.blocked.add(cell)
+        self.labels[cell] = -1
+        for i in range(offsets[cell], offsets[cell + 1] - 1):
+            # the neighbours which are still connected were relabelled by the fill of an earlier neighbour
+            if self.labels[neighbours[i]] == old_label:
+                self.fill(neighbours[i])
+
+
+    def unblock(self, cell):
+        """ Frees a blocked cell, it merges the components of its neighbours """
+        self.blocked.discard(cell)
+        self.fill(cell)
+
+
+    def setBlocked(self, locations):
+        """ Updates the blocked cells to the given locations, only the cells which changed are blocked or freed
+
+        Args:
+            locations (iterable): the (x, y) locations which are blocked, the ones outside the free cells are ignored
+        """
+        cells = {self.grid.cellId(loc) for loc in locations} - {-1}
+        for cell in self.blocked - cells:
+            self.unblock(cell)
+        for cell in cells - self.blocked:
+            self.block(cell)
+
+
+    def connected(self, loc1, loc2):
+        """ Returns True if both locations are free cells which are not blocked and are reachable from each other """
+        cell1, cell2 = self.grid.cellId(loc1), self.grid.cellId(loc2)
+        if cell1 == -1 or cell2 == -1:
+            return False
+        return self.labels[cell1] != -1 and self.labels[cell1] == self.labels[cell2]
@@ -2,29 +2,34 @@
 This file contains the implemention of distributed planning WITHOUT COORDINATION.
 """
 
-import numpy as np
-import time as timer
-from single_agent_planner import computeHeuristics, a_star, getSumOfCost
+import os
+from grid import Grid, OverlayValues
+from heuristics import getDistanceFields
+from single_agent_planner import getSumOfCost
 from aircraft import AircraftDistributed
-from cbs import detectCollision, detectCollisions
-from single_agent_planner import isConstrained, buildConstraintTable
+from connectivity import ComponentLabels
+from spatial_index import SpatialIndex
+from cbs import detectCollisions
 
 class DistributedPlanning(object):
     """ parent class for the planners_
     """
 
-    def __init__(self, my_map, starts, goals, heuristics):
+    def __init__(self, my_map, starts, goals, heuristics, workers=1):
         """my_map   - list of lists specifying obstacle positions
         starts      - [(x1, y1), (x2, y2), ...] list of start locations
         goals       - [(x1, y1), (x2, y2), ...] list of goal locations
         heuristics - [h1, h2, h3, h4] list of heuristisc
+        workers     - number of processes replanning the agents in parallel at each timestep (1 to replan them in turn,
+                      None for the number of processors)
         """
         self.CPU_time = 0
         self.my_map = my_map
+        # compiled version of the map, shared by all the low-level searches
+        self.grid = Grid(my_map)
         self.starts = starts
         self.goals = goals
         self.num_of_agents = len(goals)
-        self.heuristics = []
         self.current_heuristics = []
         
         # the locations of all agents
@@ -43,11 +48,19 @@ class DistributedPlanning(object):
         self.plan_broadcast = heuristics[3]
         # the distance an agent can see
         self.radar_radius = heuristics[4]
-        for goal in self.goals:
-            self.heuristics.append(computeHeuristics(my_map, goal))
+        # the locations of the agents indexed by bucket of the size of the radar radius, filled in initialiseAgents
+        self.agent_index = SpatialIndex(self.radar_radius)
+        # the connected components of the map without the cells of the agents parked at their goals, see findBlockages
+        self.components = None
+        # the cached distance fields are read-only, the agents penalize cells in an overlay on top of them
+        self.heuristics = [OverlayValues(self.grid, field) for field in getDistanceFields(self.grid, self.goals)]
 
         self.time = 0 # this is going to incrementaly increase and decisions are going to be made at each timestep
 
+        # the worker processes are only started once the agents have to be replanned in parallel
+        self.workers = os.cpu_count() if workers is None else workers
+        self.executor = None
+
     
     def goalsReached(self, agents):
         """ Checks if all agents reached their goals
@@ -66,38 +79,24 @@ class DistributedPlanning(object):
 
     def radarScanner(self, start_agent, agents):
         """ Starting from the start agent, it scans the map and finds all agents (and their locations) within a fixed radius distance
+            Only the agents in the buckets of the spatial index around the start agent are checked
 
         Args:
             start_agent (AircraftDistributed): scanning agent
-            agents (list of AircraftDistributed): list of agents  
-            radar_radius (int, optional): The radius at which the scan is performed. Defaults to 5.
+            agents (list of AircraftDistributed): list of agents, indexed by agent id
         """
-        
-        def distanceAgents(loc1, loc2):
-            """ Helper function which computes the (euclidian) distance between two agents
-
-            Args:
-                loc1 (tuple): location of agent 1
-                loc2 (tuple): location of agen2
-            Returns a float, containing the (euclidian) distance between the (two) agents
-            """
-
-            return np.sqrt((loc1[0] - loc2[0]) * (loc1[0] - loc2[0]) + (loc1[1] - loc2[1]) * (loc1[1] - loc2[1]))
 
         prox_loc = []
-        # creates a list with all other agents' locations
-        for agent in agents:
+        # the agents within the radar radius, in the order of their ids
+        for agent_id in self.agent_index.query(start_agent.location):
+            agent = agents[agent_id]
             if agent.id != start_agent.id:
-                # compute the distance between the starting agent and all the others, and store the locations of the ones
-                #  who are in the proximity of the starting agent (distance < radius)
+                # store the locations of the agents in the proximity of the starting agent (distance < radius)
                 # along with location, radar returns whether agent has reached its goal or not
                 # also whether the neighbour agent is blocked from its final goal
                 # also stores the neighbour id
                 # and the distance the opponent has to its goal
-                if distanceAgents(start_agent.location, agent.location) < self.radar_radius and agent.location == agent.goal:
-                    prox_loc.append({'location':agent.location,'planned_path':agent.planned_path,'reached_goal':True, 'blocked':agent.blockage, 'opponent_id': agent.id, 'opponent_dist_to_goal': agent.heuristics[agent.location]})
-                elif distanceAgents(start_agent.location, agent.location) < self.radar_radius:
-                    prox_loc.append({'location':agent.location,'planned_path':agent.planned_path,'reached_goal':False, 'blocked':agent.blockage, 'opponent_id' : agent.id, 'opponent_dist_to_goal': agent.heuristics[agent.location]})
+                prox_loc.append({'location':agent.location,'planned_path':agent.planned_path,'reached_goal':agent.location == agent.goal, 'blocked':agent.blockage, 'opponent_id': agent.id, 'opponent_dist_to_goal': agent.heuristics[agent.location]})
 
         return prox_loc
 
@@ -106,9 +105,12 @@ class DistributedPlanning(object):
         """
         agents = []
 
+        self.agent_index = SpatialIndex(self.radar_radius)
         for i in range(self.num_of_agents):
-            newAgent = AircraftDistributed(self.my_map, self.starts[i], self.goals[i], self.heuristics[i], i)
+            newAgent = AircraftDistributed(self.grid, self.starts[i], self.goals[i], self.heuristics[i], i)
             agents.append(newAgent)
+            self.agent_index.insert(i, newAgent.start)
+        self.components = ComponentLabels(self.grid)
         
         # start location of agents need to be added to paths
         for agent in agents:
@@ -6,11 +6,41 @@ import math
 import random
 import numpy as np
 import time as timer
-from single_agent_planner import a_star, computeHeuristics
+from concurrent.futures import ProcessPoolExecutor
+from grid import Grid, OverlayValues
+from heuristics import getDistanceFields
+from single_agent_planner import a_star
 from aircraft import AircraftDistributed
 from cbs import detectCollisions
 from distributed_class import DistributedPlanning
-import copy
+
+# the map and the default heuristics of a worker process of the parallel replanning, they are only read
+WORKER_GRID = None
+WORKER_HEURISTICS = None
+
+
+def initWorker(my_map, goals):
+    """ Sets up the (read-only) map and default heuristics of a worker process once, before it replans any agent
+
+    Args:
+        my_map (list): list of lists specifying obstacle positions
+        goals (list): the goal locations of the agents
+    """
+    global WORKER_GRID, WORKER_HEURISTICS
+    WORKER_GRID = Grid(my_map)
+    WORKER_HEURISTICS = getDistanceFields(WORKER_GRID, goals)
+
+
+def planInWorker(agent_id, location, goal, heuristic_changes, constraints, time):
+    """ Replans one agent in a worker process, see DistributedPlanningSolverIndividual.planAgents
+
+    Args:
+        heuristic_changes (dict): the penalties of the agent on top of its default heuristics {location: value}
+    """
+    heuristics = OverlayValues(WORKER_GRID, WORKER_HEURISTICS[agent_id])
+    heuristics.changes = heuristic_changes
+    return a_star(WORKER_GRID, location, goal, heuristics, agent_id, constraints, time, True)
+
 
 class DistributedPlanningSolverIndividual(DistributedPlanning):
     """A distributed planner where agents do not communicate with each other"""
@@ -24,6 +54,7 @@ class DistributedPlanningSolverIndividual(DistributedPlanning):
             goals (list): the list of goal locations
         """
         self.my_map = my_map
+        self.grid = Grid(my_map)
         self.starts = starts
         self.goals = goals
 
@@ -107,57 +138,75 @@ class DistributedPlanningSolverIndividual(DistributedPlanning):
             Args:
                 collision (dicts): dictionary containing the indeces of the agents, the location and the timestep of the collision
                 waiting_times (list): list with the time spent waiting by the agents
-            Returns the index of the agent who was assigned priority
+            Returns the index of the agent who has to wait
             """
             # give the priority to the agent who waited the most so far
             # this is the tie-breaker for collisions
             agent_forced_to_move = collision['a1']
 
-            if (waiting_times[collision['a1'] > waiting_times[collision['a2']]]):
+            if waiting_times[collision['a1']] > waiting_times[collision['a2']]:
                 agent_forced_to_move = collision['a2']      
             
             return agent_forced_to_move
 
-        #gather intended next locations and detect collisions
-        next_locations = self.getNextLocations(agents)
-        collisions = detectCollisions(next_locations)
-
         #create list of waiting times
         waiting_times = []
         for agent in agents:
             waiting_times.append(agent.waiting)
-        
-        counter = 0
-        while len(collisions)>0 and counter<25:
-            # while there are collisions detected and the counter has not been exhausted
-            # in case counter is exhausted, agents likely want to exchange positions and thus making one of the two agents wait, will never resolve the conflict.
-            # in this case both agents must be forced to wait
-            for agent in agents:                
-                for collision in collisions:
-                    # give the priority to the agent who waited the most so far
-                    agent_forced_to_move = assignPriority(collision, waiting_times)
-            
-                    if agent.id == agent_forced_to_move:
-                        # if the agent has a collision the non-priority agent waits a timestep
-                        agent.planned_path[0]=(agent.location)
-                        # in case one agent has two collisions associated with it, the loop needs to be exited in order not to make the agent wait twice in one timestep
-                        break
-                    if counter == 24:
-                        for agent in agents:
-                            # if the counter has been exhausted and the collision belongs to the agent, force agent to wait
-                            # this is done for both agents
-                            if agent.id == collision['a1'] or agent.id == collision['a2']:
-                                agent.planned_path[0]=(agent.location)                     
-
-            # perform same collision check and increase counter
-            next_locations = self.getNextLocations(agents)
-            collisions = detectCollisions(next_locations)
-            counter+=1
+
+        # gather intended next locations in one pass: the agents which intend to be in each cell (claimants) and
+        # the agent currently in each cell (to find the agents which want to swap their locations)
+        next_locations = [agent.planned_path[0] for agent in agents]
+        claimants = dict()
+        occupant = dict()
+        for agent in agents:
+            claimants.setdefault(next_locations[agent.id], []).append(agent.id)
+            occupant[agent.location] = agent.id
+
+        # cells whose claimants have to be checked again, an agent forced to wait claims its current cell
+        pending = list(claimants.keys())
+        def forceWait(agent_id):
+            location = agents[agent_id].location
+            if next_locations[agent_id] != location:
+                next_locations[agent_id] = location
+                agents[agent_id].planned_path[0] = location
+                claimants.setdefault(location, []).append(agent_id)
+                pending.append(location)
+
+        # two agents swapping their locations: the one without priority waits, the other one then finds it in the cell
+        # it wants to enter and waits as well
+        for agent in agents:
+            other = occupant.get(next_locations[agent.id])
+            if other is not None and agent.id < other and next_locations[agent.id] != agent.location \
+               and next_locations[other] == agent.location:
+                forceWait(assignPriority({'a1': agent.id, 'a2': other}, waiting_times))
+
+        # vertex conflicts: an agent which stays in its cell keeps it, otherwise the agent with priority enters the cell
+        # and the other claimants wait. Waiting agents claim their own cell, which propagates the waits to the agents
+        # which wanted to enter it, until no cell has two claimants. An agent waits at most once, so this is O(n)
+        while len(pending) > 0:
+            cell = pending.pop()
+            cell_claimants = [agent_id for agent_id in claimants[cell] if next_locations[agent_id] == cell]
+            claimants[cell] = cell_claimants
+            if len(cell_claimants) < 2:
+                continue
+            staying = [agent_id for agent_id in cell_claimants if agents[agent_id].location == cell]
+            if len(staying) > 0:
+                winner = staying[0]
+            else:
+                winner = cell_claimants[0]
+                for agent_id in cell_claimants[1:]:
+                    collision = {'a1': min(winner, agent_id), 'a2': max(winner, agent_id)}
+                    winner = collision['a1'] + collision['a2'] - assignPriority(collision, waiting_times)
+            for agent_id in cell_claimants:
+                if agent_id != winner:
+                    forceWait(agent_id)
 
         # once collision detection loop has been exited, update locations of all agents
         for agent in agents:
             agent.path.append(agent.planned_path[0])
             agent.location = agent.planned_path[0]
+            self.agent_index.move(agent.id, agent.location)
 
 
     def appendFinalPaths(self, agents, result):
@@ -191,24 +240,18 @@ class DistributedPlanningSolverIndividual(DistributedPlanning):
         Args:
             agents (list of AircraftDistributed): the list of the agents objects
         """
-        #creates a copy of the default map
-        temp_map = copy.deepcopy(self.my_map)                
+        # for each agent, if they have reached their goal, that map location is blocked as if it was a wall
+        # only the components around the agents which arrived at or left their goal since the last timestep are relabelled
+        self.components.setBlocked([agent.location for agent in agents if agent.location == agent.goal])
 
-        for agent in agents:
-            # for each agent, if they have reached their goal, that map location is blocked as if it was a wall
-            if agent.location == agent.goal:
-                temp_map[agent.location[0]][agent.location[1]] = True
-        
         # the counter is used to avoid a weird edge case where two agents are blocked, which produces collisions
         counter = 0
         for agent in agents:
             agent.blockage = False
             if agent.location != agent.goal:
-                # for each agent if they havent reached their goal, the heuristics is calculated
-                # in the case where their current location is not in the list of locations which have a heuristic value, this means there is no path
+                # in the case where their current location is not connected to their goal, this means there is no path
                 # then the agents blockage status is set to true
-                heuristics = computeHeuristics(temp_map, agent.goal)
-                if agent.location not in heuristics and counter == 0:
+                if not self.components.connected(agent.location, agent.goal) and counter == 0:
                     agent.blockage = True
                     counter +=1
                     # print(agent.id,"Blockage") 
@@ -218,8 +261,8 @@ class DistributedPlanningSolverIndividual(DistributedPlanning):
         Modifies the heuristic values of cells where a constraint is imposed for a certain agent
         """
         
-        # copy the agents default heuristics to impose penalties for this specific timestep only
-        agent.current_heuristics = copy.deepcopy(agent.heuristics)
+        # stack an overlay on the agents default heuristics to impose penalties for this specific timestep only
+        agent.current_heuristics = agent.heuristics.overlay()
         for neighbour in prox_loc:
             # if the neighbour has priority
             # priority is based on agent's id unless the neighbour reached its goal
@@ -232,6 +275,25 @@ class DistributedPlanningSolverIndividual(DistributedPlanning):
                 for i, planned_loc in enumerate(neighbour['planned_path']):    
                     agent.current_heuristics[planned_loc] = self.soft_heur_factor * agent.heuristics[planned_loc]
 
+    def planAgents(self, agents):
+        """ Replans all the agents from their current location and returns their paths, in the order of the agents
+            The agents plan on the same snapshot with their own constraints and heuristics, so with several workers
+            they are replanned in parallel
+
+        Args:
+            agents (list of AircraftDistributed): the list of the agents objects
+        """
+        if self.workers == 1 or len(agents) < 2:
+            return [a_star(agent.my_map, agent.location, agent.goal, agent.current_heuristics, agent.id, agent.constraints, self.time, True)
+                    for agent in agents]
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=initWorker, initargs=(self.my_map, self.goals))
+        # only the penalties are sent to the workers, they hold the default heuristics of all the agents
+        arguments = [(agent.id, agent.location, agent.goal, agent.current_heuristics.allChanges(), agent.constraints, self.time)
+                     for agent in agents]
+        return list(self.executor.map(planInWorker, *zip(*arguments)))
+
     def findSolution(self, time_limit = 60):
     
         """ Finds paths for all agents from their start locations to their goal locations."""
@@ -241,43 +303,47 @@ class DistributedPlanningSolverIndividual(DistributedPlanning):
         # this stores the paths for each agent. This list is filled once a final solution is found
         result = []
         self.CPU_time = timer.time() - start_time 
-        # simulate until all the agents reached their goals. A time limit is also imposed in case the algorithm cannot find a solution
-        while not all(self.goalsReached(agents)) and (self.time<100 and self.CPU_time <time_limit): 
-            self.CPU_time = timer.time() - start_time 
+        try:
+            # simulate until all the agents reached their goals. A time limit is also imposed in case the algorithm cannot find a solution
+            while not all(self.goalsReached(agents)) and (self.time<100 and self.CPU_time <time_limit): 
+                self.CPU_time = timer.time() - start_time 
             
-            # Find if any agents are blocked from reaching their goal by other agents who have already reached their goal
-            self.findBlockages(agents)
+                # Find if any agents are blocked from reaching their goal by other agents who have already reached their goal
+                self.findBlockages(agents)
             
-            # create constraints which will be used to run planning for each agent
-            for agent in agents:
-                #the amount of time an agent has spent waiting at a location is calculated
-                wait_time = self.waitingTime(agent)
-                if wait_time > 2:
-                    agent.heuristics[agent.path[-1]] += wait_time *agent.heuristics[agent.path[-1]] 
-                # fnds and stores the locations of nearby agents                
-                prox_loc = self.radarScanner(agent, agents)
-                # generates constraints using the prox_loc
-                agent.addConstraints(self.time, prox_loc)
-                # adjust penalties to cells which are inhibited by a neigbour agent by increasing the heuristic value of these cells
-                # the cells agents intend to inhibit in the future are also penalized based on which agent has priority
-                self.adjustHeuristics(agent, prox_loc)
+                # create constraints which will be used to run planning for each agent
+                for agent in agents:
+                    #the amount of time an agent has spent waiting at a location is calculated
+                    wait_time = self.waitingTime(agent)
+                    if wait_time > 2:
+                        agent.heuristics[agent.path[-1]] += wait_time *agent.heuristics[agent.path[-1]] 
+                    # fnds and stores the locations of nearby agents                
+                    prox_loc = self.radarScanner(agent, agents)
+                    # generates constraints using the prox_loc
+                    agent.addConstraints(self.time, prox_loc)
+                    # adjust penalties to cells which are inhibited by a neigbour agent by increasing the heuristic value of these cells
+                    # the cells agents intend to inhibit in the future are also penalized based on which agent has priority
+                    self.adjustHeuristics(agent, prox_loc)
 
                 
-            # run planning for each agent
-            for agent in agents:
-                agent.planned_path = []
-
-                # update the planned path                 
-                path = a_star(agent.my_map, agent.location, agent.goal, agent.current_heuristics, agent.id, agent.constraints, self.time, True)
-                # the planned path is stored                
-                self.appendPlannedPath(agent, path, self.plan_broadcast)                              
-        
-            # handle the possible blockage and collision situations   
-            self.blockHandling(agents)    
-            self.collisionHandling(agents)
+                # run planning for each agent, all the replans of the timestep are done before the blockages and collisions are handled
+                paths = self.planAgents(agents)
+                for agent, path in zip(agents, paths):
+                    agent.planned_path = []
 
-            # increment time
-            self.time += 1
+                    # the planned path is stored                
+                    self.appendPlannedPath(agent, path, self.plan_broadcast)                              
+        
+                # handle the possible blockage and collision situations   
+                self.blockHandling(agents)    
+                self.collisionHandling(agents)
+
+                # increment time
+                self.time += 1
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
 
         # once final solution is found, all paths are trimmed and appended to result list
         self.appendFinalPaths(agents, result)
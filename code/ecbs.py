@@ -0,0 +1,311 @@
+"""
+This file contains Enhanced CBS (ECBS), a bounded-suboptimal version of CBS.
+Both levels use focal search: among the nodes whose cost is within the suboptimality factor of the lower bound,
+the nodes with the fewest conflicts are expanded first. The sum of costs of the solution is at most
+suboptimality times the optimal sum of costs.
+"""
+
+import time as timer
+import heapq
+from cbs import CBSSolver, detectCollisions
+from grid import compileGrid
+from persistent import ConstraintChain, SharedPaths
+from single_agent_planner import buildConstraintTable, getPath, getSumOfCost
+
+
+class ConflictTable(object):
+    """ Paths of the agents hashed for the focal search, updated as the agents are replanned:
+        occupancy - packed (t * num_cells + cell) -> number of agents in the cell at timestep t
+        moves     - packed ((t * num_cells + from) * num_cells + to) -> number of agents performing the move at timestep t
+        parked    - cell -> timesteps from which on agents stay in the cell (their goal)
+    """
+
+    def __init__(self, grid):
+        """
+        Args:
+            grid (Grid): compiled map
+        """
+        self.grid = grid
+        self.occupancy, self.moves, self.parked = dict(), dict(), dict()
+
+
+    def copy(self):
+        """ Returns a copy of the table which can be updated without changing this one """
+        table = ConflictTable(self.grid)
+        table.occupancy, table.moves = self.occupancy.copy(), self.moves.copy()
+        table.parked = {cell: arrivals.copy() for cell, arrivals in self.parked.items()}
+        return table
+
+
+    def update(self, path, count):
+        """ Adds (count 1) or removes (count -1) the cells and moves of a path """
+        num_cells = self.grid.num_cells
+        cells = [self.grid.cellId(loc) for loc in path]
+        for t, cell in enumerate(cells):
+            key = t * num_cells + cell
+            self.occupancy[key] = self.occupancy.get(key, 0) + count
+            if t > 0 and cells[t - 1] != cell:
+                key = (t * num_cells + cells[t - 1]) * num_cells + cell
+                self.moves[key] = self.moves.get(key, 0) + count
+        if count > 0:
+            self.parked.setdefault(cells[-1], []).append(len(cells) - 1)
+        else:
+            self.parked[cells[-1]].remove(len(cells) - 1)
+
+
+    def add(self, path):
+        """ Adds the path of an agent to the table """
+        self.update(path, 1)
+
+
+    def remove(self, path):
+        """ Removes the path of an agent from the table, the path must have been added before """
+        self.update(path, -1)
+
+
+def focalSearch(my_map, start_loc, goal_loc, h_values, agent, constraints, suboptimality, conflict_table, time = 0):
+    """ my_map      - binary obstacle map (or its compiled Grid)
+        start_loc   - start position
+        goal_loc    - goal position
+        h_values    - heuristic values indexed by location, or the list indexed by cell id (see Grid.cellValues)
+        agent       - the ID of the agent that is being re-planned
+        constraints - constraints defining where robot should or cannot go at each timestep
+        suboptimality - the cost of the path is at most suboptimality times the cost of the shortest path
+        conflict_table - ConflictTable of the paths of the other agents, the search prefers paths with fewer conflicts
+                      with them
+        Returns the path and a lower bound of the cost of the shortest path (None, None if there is no path)
+    """
+
+    grid = compileGrid(my_map)
+    offsets, neighbours = grid.offsets, grid.neighbours
+    num_cells = grid.num_cells
+    # heuristic values indexed by cell id
+    h_cells = h_values if isinstance(h_values, list) else grid.cellValues(h_values)
+    goal_cell = grid.cellId(goal_loc)
+    start_cell = grid.cellId(start_loc)
+    h_value = h_cells[start_cell]
+    # the goal cannot be reached from the start location
+    if h_value is None:
+        return None, None
+
+    # build constraint table for this agent, see a_star
+    constraint_table = buildConstraintTable(constraints, agent, grid)
+    latest_goal_constraint = constraint_table.latestGoalConstraint(goal_cell)
+    horizon = max(constraint_table.max_time, time) + num_cells
+    occupancy, moves, parked = conflict_table.occupancy, conflict_table.moves, conflict_table.parked
+
+    # compact node store, see a_star, with the f-value and the number of conflicts of the path of each node
+    node_cell = [start_cell]
+    node_time = [time]
+    node_parent = [-1]
+    node_f = [h_value]
+    node_conflicts = [0]
+    node_expanded = [False]
+
+    # the open list holds (f, node index) tuples of all the nodes which are not expanded yet, it gives the lower bound
+    # the focal list holds (conflicts, f, node index) tuples of the nodes with f <= suboptimality * lower bound
+    # the other nodes wait in the pending list, ordered by f, until the lower bound has increased enough
+    open_list = [(h_value, 0)]
+    focal_list = [(0, h_value, 0)]
+    pending = []
+    closed_list = {time * num_cells + start_cell}
+    while len(focal_list) > 0 or len(pending) > 0:
+        # nodes which were expanded from the focal list are removed lazily from the open list
+        while node_expanded[open_list[0][1]]:
+            heapq.heappop(open_list)
+        f_min = open_list[0][0]
+        bound = suboptimality * f_min
+        while len(pending) > 0 and pending[0][0] <= bound:
+            _, idx = heapq.heappop(pending)
+            heapq.heappush(focal_list, (node_conflicts[idx], node_f[idx], idx))
+
+        _, _, curr = heapq.heappop(focal_list)
+        node_expanded[curr] = True
+        curr_cell, curr_time = node_cell[curr], node_time[curr]
+        if curr_cell == goal_cell and curr_time > latest_goal_constraint:
+            return getPath(curr, node_cell, node_parent, grid), f_min
+
+        if curr_time >= horizon:
+            continue
+
+        child_time = curr_time + 1
+        child_g = child_time - time
+        time_key = child_time * num_cells
+        for i in range(offsets[curr_cell], offsets[curr_cell + 1]):
+            child_cell = neighbours[i]
+            child_h = h_cells[child_cell]
+            child_key = time_key + child_cell
+            if child_h is None or child_key in closed_list \
+               or constraint_table.isConstrained(curr_cell, child_cell, child_time):
+                continue
+
+            # conflicts of the move with the other agents: same cell, agents parked at their goal and swaps
+            conflicts = node_conflicts[curr] + occupancy.get(child_key, 0) \
+                        + sum(1 for arrival in parked.get(child_cell, ()) if arrival < child_time) \
+                        + moves.get((time_key + child_cell) * num_cells + curr_cell, 0)
+
+            closed_list.add(child_key)
+            child_f = child_g + child_h
+            node_cell.append(child_cell)
+            node_time.append(child_time)
+            node_parent.append(curr)
+            node_f.append(child_f)
+            node_conflicts.append(conflicts)
+            node_expanded.append(False)
+            idx = len(node_cell) - 1
+            heapq.heappush(open_list, (child_f, idx))
+            if child_f <= bound:
+                heapq.heappush(focal_list, (conflicts, child_f, idx))
+            else:
+                heapq.heappush(pending, (child_f, idx))
+
+    return None, None  # Failed to find solutions
+
+
+class ECBSSolver(CBSSolver):
+    """The high-level search of Enhanced CBS."""
+
+    def __init__(self, my_map, starts, goals, suboptimality=1.05, prioritize_conflicts=False,
+                 symmetry_reasoning=False):
+        """my_map   - list of lists specifying obstacle positions
+        starts      - [(x1, y1), (x2, y2), ...] list of start locations
+        goals       - [(x1, y1), (x2, y2), ...] list of goal locations
+        suboptimality - the sum of costs of the solution is at most suboptimality times the optimal sum of costs
+        prioritize_conflicts - split on cardinal conflicts first, then on semi-cardinal ones, see CBSSolver
+        symmetry_reasoning - resolve target, corridor and rectangle conflicts in one split, see CBSSolver
+        """
+        # the nodes are ordered by the focal lists instead of the CBS heuristics
+        super().__init__(my_map, starts, goals, prioritize_conflicts=prioritize_conflicts, heuristic='none',
+                         symmetry_reasoning=symmetry_reasoning)
+        self.suboptimality = suboptimality
+
+        # the open list holds (lower bound, id, node) tuples of all the nodes which are not expanded yet
+        # the focal list holds (conflicts, cost, id, node) tuples of the nodes with cost <= suboptimality * lower bound
+        # the other nodes wait in the pending list, ordered by cost, until the lower bound has increased enough
+        self.focal_list = []
+        self.pending = []
+        self.expanded = set()
+        self.lower_bound = 0
+
+    def pushNode(self, node):
+        heapq.heappush(self.open_list, (node['lb'], self.num_of_generated, node))
+        if node['cost'] <= self.suboptimality * self.lower_bound:
+            heapq.heappush(self.focal_list, (len(node['conflicts']), node['cost'], self.num_of_generated, node))
+        else:
+            heapq.heappush(self.pending, (node['cost'], self.num_of_generated, node))
+        self.num_of_generated += 1
+
+    def popNode(self):
+        # nodes which were expanded from the focal list are removed lazily from the open list
+        while self.open_list[0][1] in self.expanded:
+            heapq.heappop(self.open_list)
+        self.lower_bound = self.open_list[0][0]
+        while len(self.pending) > 0 and self.pending[0][0] <= self.suboptimality * self.lower_bound:
+            cost, id, node = heapq.heappop(self.pending)
+            heapq.heappush(self.focal_list, (len(node['conflicts']), cost, id, node))
+
+        _, _, id, node = heapq.heappop(self.focal_list)
+        self.expanded.add(id)
+        self.num_of_expanded += 1
+        return node
+
+    def findSolution(self, disjoint=True):
+        """ Finds paths for all agents from their start locations to their goal locations
+
+        disjoint    - use disjoint splitting or not
+        Returns the paths and the CPU time, ([], 0) if there is no solution or if the time limit is hit
+        """
+
+        self.start_time = timer.time()
+        self.deadline = self.start_time + self.time_limit
+        self.disjoint = disjoint
+
+        # Generate the root node, see CBSSolver.findSolution
+        # lower_bounds  - for each agent, a lower bound of the cost of its shortest path under the constraints
+        # lb            - the sum of the lower bounds, a lower bound of the cost of the solutions of the node
+        # conflict_table - the paths of the node hashed for the focal searches, each node updates its own copy
+        root = {'cost': 0,
+                'h': 0,
+                'lb': 0,
+                'lower_bounds': [],
+                'constraints': ConstraintChain(),
+                'paths': [],
+                'collisions': [],
+                'conflicts': {},
+                'conflict_table': ConflictTable(self.grid)}
+        for i in range(self.num_of_agents):  # Find initial path for each agent, avoiding the agents planned before
+            path, lower_bound = focalSearch(self.grid, self.starts[i], self.goals[i], self.h_cells[i],
+                                            i, root['constraints'], self.suboptimality, root['conflict_table'])
+            if path is None:
+                raise BaseException('No solutions')
+            root['paths'].append(path)
+            root['conflict_table'].add(path)
+            root['lower_bounds'].append(lower_bound)
+
+        root['paths'] = SharedPaths(root['paths'])
+        root['cost'] = getSumOfCost(root['paths'])
+        root['lb'] = sum(root['lower_bounds'])
+        root['collisions'] = detectCollisions(root['paths'])
+        root['conflicts'] = {(collision['a1'], collision['a2']): collision for collision in root['collisions']}
+        self.lower_bound = root['lb']
+        self.pushNode(root)
+
+        self.CPU_time = 0
+        while (len(self.focal_list) > 0 or len(self.pending) > 0) and self.CPU_time < self.time_limit:
+            self.CPU_time = timer.time() - self.start_time
+            P = self.popNode()
+            if len(P['collisions']) == 0:
+                self.CPU_time = timer.time() - self.start_time
+                return P['paths'].toList(), self.CPU_time
+
+            collision = self.chooseCollision(P)
+            constraints = self.splitCollision(collision, P, disjoint)
+
+            for constraint in constraints:
+                Q = self.generateChild(P, constraint)
+                if Q is not None:
+                    self.pushNode(Q)
+
+        if self.CPU_time > self.time_limit:
+            print("TIME LIMIT HIT")
+            return [], 0
+
+        # the open list is exhausted: the agents cannot all reach their goals
+        return [], 0
+
+    def prepareChild(self, P, constraint):
+        """ Returns the child of node P and the agents to replan in it, see CBSSolver.prepareChild
+            The child gets its own copy of the conflict table of P, updated as its agents are replanned
+        """
+        Q, groups = super().prepareChild(P, constraint)
+        Q['conflict_table'] = P['conflict_table'].copy()
+        return Q, groups
+
+    def updatePaths(self, node, new_paths):
+        """ Replaces the paths of the replanned agents in the node and in its conflict table, see CBSSolver.updatePaths
+        """
+        for agent, path in new_paths.items():
+            node['conflict_table'].remove(node['paths'][agent])
+            node['conflict_table'].add(path)
+        super().updatePaths(node, new_paths)
+
+    def findPath(self, node, agent):
+        """ Returns the path of the agent under the constraints of the node found with focal search, None if there is none
+            The lower bound of the agent is updated in the node
+        """
+        # the focal search only sees the paths of the other agents
+        conflict_table = node['conflict_table']
+        conflict_table.remove(node['paths'][agent])
+        path, lower_bound = focalSearch(self.grid, self.starts[agent], self.goals[agent], self.h_cells[agent],
+                                        agent, node['constraints'].forAgent(agent), self.suboptimality, conflict_table)
+        conflict_table.add(node['paths'][agent])
+        if path is None:
+            return None
+
+        # the constraints of the parent are a subset of the ones of the node, so its lower bound remains valid
+        lower_bound = max(lower_bound, node['lower_bounds'][agent])
+        node['lb'] += lower_bound - node['lower_bounds'][agent]
+        # the list of the parent is shared with the node, so it is replaced instead of modified
+        node['lower_bounds'] = node['lower_bounds'].copy()
+        node['lower_bounds'][agent] = lower_bound
+        return path
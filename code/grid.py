@@ -0,0 +1,182 @@
+"""
+This file contains the Grid class, a compiled version of the obstacle map which is shared by all the low-level searches.
+"""
+
+import hashlib
+import math
+import numpy as np
+
+# the moves an agent can perform, Grid.__init__ lists the neighbours of each cell in this order
+# the wait move (0,0) is always the last one, such that it can be skipped easily when only real moves are required
+DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0), (0, 0)]
+
+
+class Grid(object):
+    """ Compiled obstacle map: the free cells are numbered with dense integer ids and the
+        moves between them are stored in a CSR-style adjacency array (wait move included)
+    """
+
+    def __init__(self, my_map):
+        """
+        Args:
+            my_map (list): list of lists specifying obstacle positions
+        """
+        self.my_map = my_map
+        self.rows = len(my_map)
+        self.columns = len(my_map[0])
+
+        # cell id -> (x, y) location and (x, y) location -> cell id, for the free cells only
+        self.locations = []
+        self.cell_ids = {}
+        for x in range(self.rows):
+            for y in range(self.columns):
+                if not my_map[x][y]:
+                    self.cell_ids[(x, y)] = len(self.locations)
+                    self.locations.append((x, y))
+        self.num_cells = len(self.locations)
+
+        # the neighbours of cell c are stored in neighbours[offsets[c]:offsets[c+1]]
+        # the last entry of each slice is the cell itself (the wait move)
+        self.offsets = [0]
+        self.neighbours = []
+        for loc in self.locations:
+            for direction in DIRECTIONS:
+                neighbour = self.cell_ids.get((loc[0] + direction[0], loc[1] + direction[1]))
+                if neighbour is not None:
+                    self.neighbours.append(neighbour)
+            self.offsets.append(len(self.neighbours))
+
+        # coordinates of the free cells as arrays, to gather/scatter dense (rows x columns) arrays by cell id
+        self.xs = np.array([loc[0] for loc in self.locations], dtype=int)
+        self.ys = np.array([loc[1] for loc in self.locations], dtype=int)
+        self.neighbour_matrix = None
+
+        # hash of the content of the map, two grids compiled from equal maps have the same key
+        obstacles = np.array(my_map, dtype=bool)
+        self.key = hashlib.sha1(str(obstacles.shape).encode() + obstacles.tobytes()).hexdigest()
+
+
+    def cellId(self, loc):
+        """ Returns the id of the cell at the given location, -1 if the location is not a free cell of the map
+
+        Args:
+            loc (tuple): (x, y) location
+        """
+        return self.cell_ids.get(loc, -1)
+
+
+    def neighbourMatrix(self):
+        """ Returns the neighbours of every cell (wait move excluded) as a (num_cells x 4) array,
+            the missing neighbours are padded with num_cells, a dummy cell which is never reachable
+        """
+        if self.neighbour_matrix is None:
+            self.neighbour_matrix = np.full((self.num_cells, 4), self.num_cells, dtype=int)
+            for cell in range(self.num_cells):
+                cell_neighbours = self.neighbours[self.offsets[cell]:self.offsets[cell + 1] - 1]
+                self.neighbour_matrix[cell, :len(cell_neighbours)] = cell_neighbours
+        return self.neighbour_matrix
+
+
+    def cellValues(self, values):
+        """ Converts a table indexed by (x, y) locations into a list indexed by cell id
+            Locations missing from the table (or infinite in a dense array) are mapped to None
+
+        Args:
+            values (dict, np.ndarray or OverlayValues): values indexed by (x, y) location (e.g. heuristics)
+        """
+        if isinstance(values, OverlayValues):
+            return values.cellValues()
+        if isinstance(values, np.ndarray):
+            return [None if math.isinf(value) else value for value in values[self.xs, self.ys].tolist()]
+        return [values.get(loc) for loc in self.locations]
+
+
+class OverlayValues(object):
+    """ Values indexed by (x, y) location (e.g. heuristics) stored as a shared read-only base array and a sparse
+        dictionary of the locations whose value was changed. An overlay can be stacked on top of other values, such
+        that temporary changes never require a copy of the base array
+    """
+
+    def __init__(self, grid, base, parent=None):
+        """
+        Args:
+            grid (Grid): compiled map
+            base (np.ndarray): values of all the locations, never modified
+            parent (OverlayValues, optional): the values this overlay is stacked on. Defaults to None.
+        """
+        self.grid = grid
+        self.base = base
+        self.parent = parent
+        # (x, y) location -> changed value
+        self.changes = dict()
+        # the base values indexed by cell id, converted once and shared with the overlays stacked on these values
+        self.base_cells = None
+
+
+    def __getitem__(self, loc):
+        if loc in self.changes:
+            return self.changes[loc]
+        if self.parent is not None:
+            return self.parent[loc]
+        return self.base[loc]
+
+
+    def __setitem__(self, loc, value):
+        self.changes[loc] = value
+
+
+    def overlay(self):
+        """ Returns new values stacked on these ones, the changes of the overlay leave these values unchanged """
+        return OverlayValues(self.grid, self.base, self)
+
+
+    def cellValues(self):
+        """ Returns the values indexed by cell id (None for the infinite ones), see Grid.cellValues
+            The base values are shared, only the changed cells are stored
+        """
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        if root.base_cells is None:
+            root.base_cells = self.grid.cellValues(root.base)
+
+        changes = {self.grid.cellId(loc): None if math.isinf(value) else float(value)
+                   for loc, value in self.allChanges().items()}
+        return OverlayCells(root.base_cells, changes)
+
+
+    def allChanges(self):
+        """ Returns the changes of all the layers as one dictionary {(x, y) location: value} """
+        if self.parent is None:
+            return dict(self.changes)
+        # the changes of the top layers take precedence over the ones they are stacked on
+        changes = self.parent.allChanges()
+        changes.update(self.changes)
+        return changes
+
+
+class OverlayCells(object):
+    """ Values indexed by cell id: the shared values of an OverlayValues base and the cells which were changed """
+
+    __slots__ = ('base_cells', 'changes')
+
+    def __init__(self, base_cells, changes):
+        self.base_cells = base_cells
+        self.changes = changes
+
+
+    def __getitem__(self, cell):
+        if cell in self.changes:
+            return self.changes[cell]
+        return self.base_cells[cell]
+
+
+def compileGrid(my_map):
+    """ Returns the Grid of the map, the map is only compiled if it was not compiled before
+
+    Args:
+        my_map (list or Grid): list of lists specifying obstacle positions or an already compiled grid
+    """
+    if isinstance(my_map, Grid):
+        return my_map
+    return Grid(my_map)
@@ -0,0 +1,137 @@
+"""
+This file contains the computation of the heuristics (distance fields to the goals) used by the low-level searches.
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+from grid import compileGrid
+
+
+def computeDistanceFields(my_map, goals):
+    """ Computes the distance fields of many goals at once with a breadth-first search
+        All the goals are expanded together, one frontier per goal, level by level
+
+    Args:
+        my_map (list or Grid): list of lists specifying obstacle positions or the compiled grid
+        goals (list): [(x1, y1), (x2, y2), ...] list of goal locations
+    Returns a list with a dense (rows x columns) array per goal, containing the number of moves
+        from each cell to the goal (np.inf for obstacles and cells from which the goal cannot be reached)
+    """
+    grid = compileGrid(my_map)
+    num_goals = len(goals)
+    if num_goals == 0:
+        return []
+
+    # the extra column is the dummy cell used to pad the neighbour matrix, it is never reached
+    neighbour_matrix = grid.neighbourMatrix()
+    distances = np.full((num_goals, grid.num_cells), np.inf)
+    frontier = np.zeros((num_goals, grid.num_cells + 1), dtype=bool)
+    reached = np.zeros((num_goals, grid.num_cells), dtype=bool)
+
+    goal_rows = np.arange(num_goals)
+    goal_cells = [grid.cellId(goal) for goal in goals]
+    frontier[goal_rows, goal_cells] = True
+    reached[goal_rows, goal_cells] = True
+    distances[goal_rows, goal_cells] = 0
+
+    level = 0
+    while frontier.any():
+        level += 1
+        # a cell enters the next frontier if any of its neighbours is in the current frontier
+        next_frontier = frontier[:, neighbour_matrix].any(axis=2) & ~reached
+        distances[next_frontier] = level
+        reached |= next_frontier
+        frontier[:, :grid.num_cells] = next_frontier
+
+    fields = np.full((num_goals, grid.rows, grid.columns), np.inf)
+    fields[:, grid.xs, grid.ys] = distances
+    return list(fields)
+
+
+class HeuristicCache(object):
+    """ Memoizes the distance fields by (map content hash, goal location)
+        The fields are kept in an in-process LRU and, optionally, stored on disk as .npy files
+        such that they can be reused by later runs
+    """
+
+    def __init__(self, max_size=4096, directory=None):
+        """
+        Args:
+            max_size (int): maximum number of distance fields kept in memory
+            directory (str, optional): directory of the on-disk store. Defaults to None (memory only).
+        """
+        self.max_size = max_size
+        self.directory = directory
+        self.fields = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def fieldPath(self, key):
+        """ Returns the file in which the distance field with the given key is stored """
+        map_key, goal = key
+        return os.path.join(self.directory, f"{map_key}-{goal[0]}_{goal[1]}.npy")
+
+
+    def lookup(self, key):
+        """ Returns the cached distance field, None if it is neither in memory nor on disk """
+        if key in self.fields:
+            self.fields.move_to_end(key)
+            return self.fields[key]
+        if self.directory is not None and os.path.isfile(self.fieldPath(key)):
+            field = np.load(self.fieldPath(key))
+            self.store(key, field, False)
+            return field
+        return None
+
+
+    def store(self, key, field, save = True):
+        """ Adds a distance field to the cache, evicting the least recently used one when the cache is full """
+        # the fields are shared by all the solvers, so they must not be modified
+        field.flags.writeable = False
+        self.fields[key] = field
+        self.fields.move_to_end(key)
+        if len(self.fields) > self.max_size:
+            self.fields.popitem(last=False)
+        if save and self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            np.save(self.fieldPath(key), field)
+
+
+    def getFields(self, my_map, goals):
+        """ Returns the (read-only) distance fields of the goals, only the missing ones are computed
+
+        Args:
+            my_map (list or Grid): list of lists specifying obstacle positions or the compiled grid
+            goals (list): [(x1, y1), (x2, y2), ...] list of goal locations
+        """
+        grid = compileGrid(my_map)
+        fields = dict()
+        for goal in goals:
+            if goal not in fields:
+                fields[goal] = self.lookup((grid.key, goal))
+
+        missing = [goal for goal, field in fields.items() if field is None]
+        self.hits += len(fields) - len(missing)
+        self.misses += len(missing)
+        # the missing fields are computed in one batch
+        for goal, field in zip(missing, computeDistanceFields(grid, missing)):
+            fields[goal] = field.copy()
+            self.store((grid.key, goal), fields[goal])
+
+        return [fields[goal] for goal in goals]
+
+
+# cache shared by all the solvers of this process
+HEURISTIC_CACHE = HeuristicCache()
+
+
+def getDistanceFields(my_map, goals):
+    """ Returns the distance fields of the goals from the shared cache, see HeuristicCache.getFields """
+    return HEURISTIC_CACHE.getFields(my_map, goals)
+
+
+def setCacheDirectory(directory):
+    """ Enables (or disables, when directory is None) the on-disk store of the shared cache """
+    HEURISTIC_CACHE.directory = directory
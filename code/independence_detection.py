@@ -0,0 +1,150 @@
+"""
+This file contains independence detection, a wrapper around the other solvers which decomposes an instance into
+groups of agents that can be planned independently of each other.
+Every agent starts in its own group and is planned alone. As long as the paths of two groups collide, the groups
+are merged and the merged group is solved jointly with the selected solver. The groups which have to be solved in
+the same iteration are independent of each other, so they are solved in parallel processes.
+"""
+
+import time as timer
+from concurrent.futures import ProcessPoolExecutor
+from cbs import CBSSolver, detectCollisions
+from ecbs import ECBSSolver
+from grid import Grid
+from heuristics import getDistanceFields
+from prioritized import PrioritizedPlanningSolver
+from single_agent_planner import a_star
+
+
+def solveGroup(solver, my_map, starts, goals, options):
+    """ Solves one group of agents with the selected solver, returns the paths of the agents ([] if there is no solution)
+        This is a module-level function, such that it can be run in a worker process
+
+    Args:
+        solver (str): the solver of the groups, 'CBS', 'ECBS' or 'Prioritized'
+        my_map (list): list of lists specifying obstacle positions
+        starts, goals (list): start and goal locations of the agents of the group
+        options (dict): options of the solver, see IndependenceDetectionSolver
+    """
+    if solver == "CBS":
+        cbs = CBSSolver(my_map, starts, goals, options.get('low_level', 'astar'),
+                        prioritize_conflicts=options.get('prioritize_conflicts', False),
+                        heuristic=options.get('cbs_heuristic', 'none'),
+                        symmetry_reasoning=options.get('symmetry_reasoning', False),
+                        merge_threshold=options.get('merge_threshold'), merge_policy=options.get('merge_policy', 'joint'))
+        paths, _ = cbs.findSolution(options.get('disjoint', False))
+    elif solver == "ECBS":
+        ecbs = ECBSSolver(my_map, starts, goals, options.get('suboptimality', 1.05),
+                          prioritize_conflicts=options.get('prioritize_conflicts', False),
+                          symmetry_reasoning=options.get('symmetry_reasoning', False))
+        paths, _ = ecbs.findSolution(options.get('disjoint', False))
+    elif solver == "Prioritized":
+        prioritized = PrioritizedPlanningSolver(my_map, starts, goals, options.get('low_level', 'astar'))
+        paths, _ = prioritized.find_solution()
+    else:
+        raise RuntimeError("Unknown solver!")
+
+    # the solvers return an empty list (or no list at all) if they do not find a solution
+    if not isinstance(paths, list) or len(paths) != len(goals):
+        return []
+    return paths
+
+
+class IndependenceDetectionSolver(object):
+    """A planner that only plans the agents whose paths interact jointly."""
+
+    def __init__(self, my_map, starts, goals, solver='CBS', options=None, workers=1):
+        """my_map   - list of lists specifying obstacle positions
+        starts      - [(x1, y1), (x2, y2), ...] list of start locations
+        goals       - [(x1, y1), (x2, y2), ...] list of goal locations
+        solver      - the solver of the groups of agents, 'CBS', 'ECBS' or 'Prioritized'
+        options     - options of the solver: 'low_level', 'prioritize_conflicts', 'cbs_heuristic',
+                      'symmetry_reasoning', 'merge_threshold', 'merge_policy', 'disjoint' and 'suboptimality'
+        workers     - number of processes solving the groups in parallel (1 to solve them in turn, None for the number of
+                      processors)
+        """
+
+        self.my_map = my_map
+        # compiled version of the map, shared by all the low-level searches
+        self.grid = Grid(my_map)
+        self.starts = starts
+        self.goals = goals
+        self.num_of_agents = len(goals)
+        self.solver = solver
+        self.options = dict() if options is None else options
+        self.workers = workers
+
+        self.CPU_time = 0
+        self.num_of_merges = 0
+        # the groups of agents of the last solution
+        self.groups = []
+
+        # compute heuristics for the low-level search
+        # the distance fields are shared with the other solvers through the heuristics cache
+        self.heuristics = getDistanceFields(self.grid, self.goals)
+
+    def findSolution(self):
+        """ Finds paths for all agents from their start locations to their goal locations."""
+
+        start_time = timer.time()
+
+        # every agent starts in its own group, planned alone
+        groups = [[i] for i in range(self.num_of_agents)]
+        paths = []
+        for i in range(self.num_of_agents):
+            path = a_star(self.grid, self.starts[i], self.goals[i], self.heuristics[i], i, [])
+            if path is None:
+                raise BaseException('No solutions')
+            paths.append(path)
+
+        # the worker processes are only started once groups have to be solved in parallel
+        executor = None
+        try:
+            while True:
+                collisions = detectCollisions(paths)
+                group_of = {agent: g for g, group in enumerate(groups) for agent in group}
+                conflicting = [(group_of[collision['a1']], group_of[collision['a2']]) for collision in collisions
+                               if group_of[collision['a1']] != group_of[collision['a2']]]
+                if len(conflicting) == 0:
+                    break
+
+                # all the groups with colliding paths are merged at once (union-find over the conflicting pairs)
+                parent = list(range(len(groups)))
+                def find(g):
+                    while parent[g] != g:
+                        parent[g] = parent[parent[g]]
+                        g = parent[g]
+                    return g
+                for g1, g2 in conflicting:
+                    parent[find(g1)] = find(g2)
+                merged = dict()
+                for g, group in enumerate(groups):
+                    merged.setdefault(find(g), []).append(group)
+                self.num_of_merges += len(groups) - len(merged)
+                groups = [sorted(agent for group in parts for agent in group) for parts in merged.values()]
+                # only the groups formed by merging other groups have to be solved again
+                new_groups = [group for parts, group in zip(merged.values(), groups) if len(parts) > 1]
+
+                # the merged groups are independent of each other, so they are solved in parallel
+                arguments = [(self.solver, self.my_map, [self.starts[i] for i in group], [self.goals[i] for i in group], self.options)
+                             for group in new_groups]
+                if self.workers == 1 or len(new_groups) == 1:
+                    results = [solveGroup(*args) for args in arguments]
+                else:
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=self.workers)
+                    results = list(executor.map(solveGroup, *zip(*arguments)))
+
+                for group, group_paths in zip(new_groups, results):
+                    if len(group_paths) == 0:
+                        self.CPU_time = timer.time() - start_time
+                        return [], 0
+                    for i, path in zip(group, group_paths):
+                        paths[i] = path
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.groups = groups
+        self.CPU_time = timer.time() - start_time
+        return paths, self.CPU_time
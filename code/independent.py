@@ -1,5 +1,7 @@
 import time as timer
-from single_agent_planner import computeHeuristics, a_star, getSumOfCost
+from grid import Grid
+from heuristics import getDistanceFields
+from single_agent_planner import a_star, getSumOfCost
 
 
 class IndependentSolver(object):
@@ -12,6 +14,8 @@ class IndependentSolver(object):
         """
 
         self.my_map = my_map
+        # compiled version of the map, shared by all the low-level searches
+        self.grid = Grid(my_map)
         self.starts = starts
         self.goals = goals
         self.num_of_agents = len(goals)
@@ -19,9 +23,8 @@ class IndependentSolver(object):
         self.CPU_time = 0
 
         # compute heuristics for the low-level search
-        self.heuristics = []
-        for goal in self.goals:
-            self.heuristics.append(computeHeuristics(my_map, goal))
+        # the distance fields are shared with the other solvers through the heuristics cache
+        self.heuristics = getDistanceFields(self.grid, self.goals)
 
     def find_solution(self):
         """ Finds paths for all agents from their start locations to their goal locations."""
@@ -30,7 +33,7 @@ class IndependentSolver(object):
         result = []
 
         for i in range(self.num_of_agents):  # Find path for each agent
-            path = a_star(self.my_map, self.starts[i], self.goals[i], self.heuristics[i],
+            path = a_star(self.grid, self.starts[i], self.goals[i], self.heuristics[i],
                           i, [])
             if path is None:
                 raise BaseException('No solutions')
@@ -0,0 +1,134 @@
+"""
+This file contains the multi-valued decision diagrams (MDDs) used by CBS to classify its conflicts.
+The MDD of an agent for a given cost holds, for every timestep, the cells the agent can be in on any of its
+paths of that cost which satisfy its constraints.
+"""
+
+from collections import OrderedDict
+from grid import compileGrid
+from single_agent_planner import buildConstraintTable
+
+
+def constraintKey(constraints):
+    """ Returns a hashable key of a list of constraints, equal lists of constraints (in any order) have equal keys
+
+    Args:
+        constraints (iterable): constraints as used by CBS, {'agent', 'loc', 'timestep'(, 'positive', 'type')}
+    """
+    return frozenset((constraint['agent'], tuple(constraint['loc']), constraint['timestep'], constraint.get('positive', False),
+                      constraint.get('type')) for constraint in constraints)
+
+
+def buildMDD(my_map, start_loc, goal_loc, h_values, agent, constraints, cost):
+    """ Returns the MDD of the agent as a list of sets of cell ids, one set per timestep (0 up to cost)
+        An empty list is returned if the agent has no path of the given cost
+
+    Args:
+        my_map (list or Grid): obstacle map (or its compiled Grid)
+        start_loc, goal_loc (tuple): start and goal location of the agent
+        h_values (dict or np.ndarray): distances to the goal location
+        agent (int): the agent id
+        constraints (list or ConstraintTable): the constraints of the agent
+        cost (int): the length of the paths (number of moves)
+    """
+    grid = compileGrid(my_map)
+    offsets, neighbours = grid.offsets, grid.neighbours
+    h_cells = h_values if isinstance(h_values, list) else grid.cellValues(h_values)
+    constraint_table = buildConstraintTable(constraints, agent, grid)
+
+    # forward sweep: the cells reachable at each timestep from which the goal can still be reached in time
+    levels = [{grid.cellId(start_loc)}]
+    for t in range(1, cost + 1):
+        level = set()
+        for cell in levels[-1]:
+            for i in range(offsets[cell], offsets[cell + 1]):
+                next_cell = neighbours[i]
+                if h_cells[next_cell] is not None and t + h_cells[next_cell] <= cost \
+                   and not constraint_table.isConstrained(cell, next_cell, t):
+                    level.add(next_cell)
+        levels.append(level)
+
+    # backward sweep: only the cells from which the goal is reached at timestep cost are kept
+    goal_cell = grid.cellId(goal_loc)
+    if goal_cell not in levels[cost]:
+        return []
+    levels[cost] = {goal_cell}
+    for t in range(cost - 1, -1, -1):
+        levels[t] = {cell for cell in levels[t]
+                     if any(neighbours[i] in levels[t + 1] and not constraint_table.isConstrained(cell, neighbours[i], t + 1)
+                            for i in range(offsets[cell], offsets[cell + 1]))}
+    return levels
+
+
+def mddWidth(mdd, t):
+    """ Returns the number of cells of the MDD at timestep t, after the end of the paths the agent stays at its goal """
+    if t < len(mdd):
+        return len(mdd[t])
+    return 1
+
+
+def classifyConflict(collision, mdd1, mdd2):
+    """ Returns 'cardinal' if resolving the collision increases the cost of both agents, 'semi-cardinal' if it
+        increases the cost of one of them and 'non-cardinal' otherwise
+
+    Args:
+        collision (dict): {'a1', 'a2', 'loc', 'timestep'} as returned by detectCollisions
+        mdd1, mdd2 (list): MDDs of the current paths of the agents a1 and a2
+    """
+    t = collision['timestep']
+    # an agent cannot avoid a vertex if it is the only cell of its MDD at the timestep,
+    # and it cannot avoid an edge if both ends are the only cells of its MDD at the two timesteps
+    if len(collision['loc']) == 1:
+        cardinal = [mddWidth(mdd, t) == 1 for mdd in (mdd1, mdd2)]
+    else:
+        cardinal = [mddWidth(mdd, t - 1) == 1 and mddWidth(mdd, t) == 1 for mdd in (mdd1, mdd2)]
+
+    if all(cardinal):
+        return 'cardinal'
+    elif any(cardinal):
+        return 'semi-cardinal'
+    return 'non-cardinal'
+
+
+class MDDCache(object):
+    """ Least recently used cache of the MDDs of the agents, indexed by agent, cost and set of constraints """
+
+    def __init__(self, grid, starts, goals, heuristics, max_size=100000):
+        """
+        Args:
+            grid (Grid): compiled map
+            starts, goals (list): start and goal locations of the agents
+            heuristics (list): distances to the goal of each agent (or the lists indexed by cell id)
+            max_size (int, optional): maximum number of MDDs kept in memory
+        """
+        self.grid = grid
+        self.starts = starts
+        self.goals = goals
+        # the heuristics are converted once to lists indexed by cell id
+        self.h_cells = [h_values if isinstance(h_values, list) else grid.cellValues(h_values) for h_values in heuristics]
+        self.max_size = max_size
+        self.mdds = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def getMDD(self, agent, constraints, cost):
+        """ Returns the MDD of the agent for the given constraints and cost, it is only built if it is not cached
+
+        Args:
+            agent (int): the agent id
+            constraints (list): the constraints of the agent
+            cost (int): the length of the current path of the agent (number of moves)
+        """
+        key = (agent, cost, constraintKey(constraints))
+        if key in self.mdds:
+            self.hits += 1
+            self.mdds.move_to_end(key)
+            return self.mdds[key]
+
+        self.misses += 1
+        mdd = buildMDD(self.grid, self.starts[agent], self.goals[agent], self.h_cells[agent], agent, constraints, cost)
+        self.mdds[key] = mdd
+        if len(self.mdds) > self.max_size:
+            self.mdds.popitem(last=False)
+        return mdd
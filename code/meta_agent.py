@@ -0,0 +1,147 @@
+"""
+This file contains the joint low-level search of the meta-agents of CBS (MA-CBS).
+A meta-agent is a group of agents which collided too often along a branch of the CBS tree; its agents are planned
+together by an A* search over their combined states, such that they never collide with each other.
+"""
+
+import heapq
+import math
+import time as timer
+from grid import compileGrid
+from single_agent_planner import buildConstraintTable
+
+
+class TimeLimitExceeded(Exception):
+    """ Raised when a search is aborted at the deadline of the solver. It is not an answer (unlike None, which means
+        that there is no path), so it must never be cached
+    """
+
+
+def jointAStar(my_map, start_locs, goal_locs, h_values, agents, constraints, deadline=math.inf):
+    """ my_map      - binary obstacle map (or its compiled Grid)
+        start_locs  - start positions of the agents of the meta-agent
+        goal_locs   - goal positions of the agents of the meta-agent
+        h_values    - heuristics of the agents of the meta-agent
+        agents      - the IDs of the agents of the meta-agent
+        constraints - for each agent, the constraints defining where it should or cannot go at each timestep
+        deadline    - time (as returned by time.time()) after which the search is aborted with TimeLimitExceeded
+        Returns the paths of the agents with the minimal sum of costs, None if there are none
+    """
+
+    grid = compileGrid(my_map)
+    offsets, neighbours = grid.offsets, grid.neighbours
+    num_agents = len(agents)
+    h_cells = [agent_h_values if isinstance(agent_h_values, list) else grid.cellValues(agent_h_values)
+               for agent_h_values in h_values]
+    start_cells = tuple(grid.cellId(loc) for loc in start_locs)
+    goal_cells = [grid.cellId(loc) for loc in goal_locs]
+    if any(h_cells[i][start_cells[i]] is None for i in range(num_agents)):
+        return None
+
+    tables = [buildConstraintTable(constraints[i], agents[i], grid) for i in range(num_agents)]
+    # an agent can only finish its path at its goal after this timestep, see a_star
+    latest_goal_constraints = [tables[i].latestGoalConstraint(goal_cells[i]) for i in range(num_agents)]
+    # after the last constraint of all the agents the search is not continued, see a_star
+    max_time = max(table.max_time for table in tables)
+    horizon = max_time + grid.num_cells
+
+    def stateKey(cells, arrivals, t):
+        # after the last constraint the map no longer changes: a configuration reached again later with the same
+        # arrivals at the goals is never better, since the earlier one can wait until then
+        return (cells, arrivals) if t > max_time else (cells, t)
+
+    def agentCost(i, cell, arrival, t):
+        # an agent at its goal finishes at its arrival (or once it is allowed to finish), the others at t + h at the earliest
+        if cell == goal_cells[i]:
+            return max(arrival, latest_goal_constraints[i] + 1)
+        return max(t + h_cells[i][cell], latest_goal_constraints[i] + 1)
+
+    # operator decomposition: the agents move one after the other, such that a node has at most 5 children instead
+    # of 5^k. The intermediate nodes, in which the first agents have already moved to the next timestep, are not
+    # checked for duplicates, only the full states (all the agents at the same timestep) are.
+    # compact node store, see a_star: the cells of the agents, the timestep of the agents which did not move yet,
+    # the number of agents which moved, the cells before the move (intermediate nodes only) and for each agent the
+    # timestep at which it arrived at its goal and stayed there since (-1 if it is not at its goal)
+    start_arrivals = tuple(0 if start_cells[i] == goal_cells[i] else -1 for i in range(num_agents))
+    node_cells = [start_cells]
+    node_time = [0]
+    node_moved = [0]
+    node_prev = [None]
+    node_arrivals = [start_arrivals]
+    node_parent = [-1]
+
+    start_f = sum(agentCost(i, start_cells[i], start_arrivals[i], 0) for i in range(num_agents))
+    # the open list holds (f, -timestep, -moved, node index) tuples, ties are broken in favour of the deepest nodes
+    open_list = [(start_f, 0, 0, 0)]
+    # full states which were already expanded (see stateKey), the first expansion has the earliest arrivals at the goals
+    closed_list = set()
+    expansions = 0
+    while len(open_list) > 0:
+        # the joint search can be very large, so the deadline is checked during the search
+        expansions += 1
+        if expansions % 1000 == 0 and timer.time() > deadline:
+            raise TimeLimitExceeded()
+        _, _, _, curr = heapq.heappop(open_list)
+        cells, curr_time, moved, arrivals = node_cells[curr], node_time[curr], node_moved[curr], node_arrivals[curr]
+        if moved == 0:
+            if stateKey(cells, arrivals, curr_time) in closed_list:
+                continue
+            closed_list.add(stateKey(cells, arrivals, curr_time))
+
+            # all the agents are at their goals and are allowed to stay there
+            if all(cells[i] == goal_cells[i] for i in range(num_agents)) and curr_time > max(latest_goal_constraints):
+                return getJointPaths(curr, node_cells, node_moved, node_parent,
+                                     [max(arrivals[i], latest_goal_constraints[i] + 1) for i in range(num_agents)], grid)
+
+            if curr_time >= horizon:
+                continue
+            prev = cells
+        else:
+            prev = node_prev[curr]
+
+        # the next agent moves, respecting its own constraints and without colliding with the agents which already
+        # moved (vertex and edge collisions), the other agents check the collisions with it when they move
+        i = moved
+        child_time = curr_time + 1
+        child_moved = (moved + 1) % num_agents
+        for next_cell in neighbours[offsets[prev[i]]:offsets[prev[i] + 1]]:
+            if h_cells[i][next_cell] is None or tables[i].isConstrained(prev[i], next_cell, child_time):
+                continue
+            if any(next_cell == cells[j] or (next_cell == prev[j] and cells[j] == prev[i]) for j in range(i)):
+                continue
+            child_cells = cells[:i] + (next_cell,) + cells[i + 1:]
+            if next_cell != goal_cells[i]:
+                arrival = -1
+            elif prev[i] == goal_cells[i] and arrivals[i] != -1:
+                arrival = arrivals[i]
+            else:
+                arrival = child_time
+            child_arrivals = arrivals[:i] + (arrival,) + arrivals[i + 1:]
+            if child_moved == 0 and stateKey(child_cells, child_arrivals, child_time) in closed_list:
+                continue
+            child_f = sum(agentCost(j, child_cells[j], child_arrivals[j], child_time if j <= i else curr_time)
+                          for j in range(num_agents))
+
+            node_cells.append(child_cells)
+            node_time.append(child_time if child_moved == 0 else curr_time)
+            node_moved.append(child_moved)
+            node_prev.append(None if child_moved == 0 else prev)
+            node_arrivals.append(child_arrivals)
+            node_parent.append(curr)
+            heapq.heappush(open_list, (child_f, -node_time[-1], -child_moved, len(node_cells) - 1))
+
+    return None  # Failed to find solutions
+
+
+def getJointPaths(goal_node, node_cells, node_moved, node_parent, ends, grid):
+    """ Rebuilds the paths of the agents ending in goal_node, the path of agent i ends at timestep ends[i]
+        Only the full states are part of the paths, the intermediate nodes of operator decomposition are skipped
+    """
+    states = []
+    curr = goal_node
+    while curr != -1:
+        if node_moved[curr] == 0:
+            states.append(node_cells[curr])
+        curr = node_parent[curr]
+    states.reverse()
+    return [[grid.locations[cells[i]] for cells in states[:end + 1]] for i, end in enumerate(ends)]
@@ -0,0 +1,65 @@
+"""
+This file contains the cache of the low-level paths of CBS.
+The path of an agent only depends on its own constraints (and the positive constraints of the other agents), so the
+sibling and cousin nodes of the CBS tree which give an agent the same constraints can share its path.
+"""
+
+from collections import OrderedDict
+from mdd import constraintKey
+
+
+class PathCache(object):
+    """ Least recently used cache of the low-level paths, indexed by agent (or meta-agent) and set of constraints """
+
+    def __init__(self, max_size=100000):
+        """
+        Args:
+            max_size (int, optional): maximum number of paths kept in memory
+        """
+        self.max_size = max_size
+        self.paths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def getPath(self, agent, constraints, plan):
+        """ Returns the path of the agent under the constraints, it is only planned if it is not cached
+            The paths are shared by the nodes and must not be modified
+
+        Args:
+            agent (int or tuple): the agent id, or the agents of a meta-agent
+            constraints (list): the constraints of the agent (for a meta-agent, of all its agents)
+            plan (function): plans the path when it is not cached, returns None if there is no path. Nothing is cached
+                when it raises (e.g. TimeLimitExceeded)
+        """
+        found, path = self.lookup(agent, constraints)
+        if not found:
+            path = plan()
+            self.store(agent, constraints, path)
+        return path
+
+
+    def lookup(self, agent, constraints):
+        """ Returns (True, path) if the path of the agent under the constraints is cached, (False, None) otherwise """
+        key = (agent, constraintKey(constraints))
+        if key in self.paths:
+            self.hits += 1
+            self.paths.move_to_end(key)
+            return True, self.paths[key]
+        self.misses += 1
+        return False, None
+
+
+    def store(self, agent, constraints, path):
+        """ Adds a path to the cache, evicting the least recently used one when the cache is full
+            An agent without a path under the constraints is cached as well, with path None
+        """
+        self.paths[(agent, constraintKey(constraints))] = path
+        if len(self.paths) > self.max_size:
+            self.paths.popitem(last=False)
+
+
+    def hitRate(self):
+        """ Returns the fraction of the lookups which were answered from the cache, 0 if there were none """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0
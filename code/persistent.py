@@ -0,0 +1,129 @@
+"""
+This file contains persistent (structurally shared) versions of the constraint list and the path list of the CBS nodes.
+A child node only stores what it adds to its parent, instead of a copy of the parent's lists.
+"""
+
+
+class ConstraintChain(object):
+    """ Persistent list of constraints: every node of the chain holds one constraint and a link to its parent """
+
+    __slots__ = ('constraint', 'parent', 'length', 'agent_constraints')
+
+    def __init__(self, constraint=None, parent=None):
+        """
+        Args:
+            constraint (dict, optional): the constraint added by this link, None for the empty chain
+            parent (ConstraintChain, optional): the chain the constraint is added to
+        """
+        self.constraint = constraint
+        self.parent = parent
+        self.length = 0 if parent is None else parent.length + 1
+        # per-agent index: the constraints of an agent along the chain, filled in when they are first needed
+        self.agent_constraints = dict()
+
+
+    def add(self, constraint):
+        """ Returns a new chain with one more constraint, the current chain is left unchanged """
+        return ConstraintChain(constraint, self)
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __iter__(self):
+        """ Iterates over the constraints from the oldest to the most recent one """
+        constraints = []
+        link = self
+        while link.parent is not None:
+            constraints.append(link.constraint)
+            link = link.parent
+        return reversed(constraints)
+
+
+    def forAgent(self, agent):
+        """ Returns the list of constraints of the agent (and the positive constraints of the other agents, which
+            also constrain the agent), the list is shared and must not be modified
+
+        Args:
+            agent (int): the agent id
+        """
+        # walk up until a link which already knows the constraints of the agent
+        links = []
+        link = self
+        while link is not None and agent not in link.agent_constraints:
+            links.append(link)
+            link = link.parent
+        constraints = [] if link is None else link.agent_constraints[agent]
+
+        # the links on the way down reuse the list of their parent unless they add a constraint of the agent
+        for link in reversed(links):
+            if link.constraint is not None and (link.constraint['agent'] == agent or link.constraint.get('positive', False)):
+                constraints = constraints + [link.constraint]
+            link.agent_constraints[agent] = constraints
+        return constraints
+
+
+class SharedPaths(object):
+    """ Copy-on-write list of paths: a child shares the paths of its parent and only stores the replanned path """
+
+    __slots__ = ('paths', 'parent', 'agent', 'path', 'depth')
+
+    # a node more than MAX_DEPTH links away from a materialized list gets its own list, this bounds the cost of a lookup
+    MAX_DEPTH = 8
+
+    def __init__(self, paths=None, parent=None, agent=None, path=None):
+        """
+        Args:
+            paths (list, optional): list of paths of all agents (materialized node)
+            parent (SharedPaths, optional): the paths this node is derived from
+            agent (int, optional): the agent whose path is replaced
+            path (list, optional): the new path of the agent
+        """
+        self.paths = paths
+        self.parent = parent
+        self.agent = agent
+        self.path = path
+        self.depth = 0 if parent is None else parent.depth + 1
+
+
+    def replace(self, agent, path):
+        """ Returns new paths in which the path of the agent is replaced, the current paths are left unchanged """
+        if self.depth >= SharedPaths.MAX_DEPTH:
+            paths = self.toList()
+            paths[agent] = path
+            return SharedPaths(paths)
+        return SharedPaths(parent=self, agent=agent, path=path)
+
+
+    def __getitem__(self, agent):
+        node = self
+        while node.paths is None:
+            if node.agent == agent:
+                return node.path
+            node = node.parent
+        return node.paths[agent]
+
+
+    def __len__(self):
+        node = self
+        while node.paths is None:
+            node = node.parent
+        return len(node.paths)
+
+
+    def __iter__(self):
+        return iter(self.toList())
+
+
+    def toList(self):
+        """ Returns the paths as a new list """
+        replaced = dict()
+        node = self
+        while node.paths is None:
+            replaced.setdefault(node.agent, node.path)
+            node = node.parent
+        paths = node.paths.copy()
+        for agent, path in replaced.items():
+            paths[agent] = path
+        return paths
@@ -1,39 +1,49 @@
 import time as timer
-from single_agent_planner import computeHeuristics, a_star, getSumOfCost
+from grid import Grid
+from heuristics import getDistanceFields
+from reservation_table import ReservationTable
+from sipp import sipp
+from single_agent_planner import a_star
 
 
 class PrioritizedPlanningSolver(object):
     """A planner that plans for each robot sequentially."""
 
-    def __init__(self, my_map, starts, goals):
+    def __init__(self, my_map, starts, goals, low_level='astar'):
         """my_map   - list of lists specifying obstacle positions
         starts      - [(x1, y1), (x2, y2), ...] list of start locations
         goals       - [(x1, y1), (x2, y2), ...] list of goal locations
+        low_level   - the low-level search, 'astar' (time-expanded A*) or 'sipp' (Safe Interval Path Planning)
         """
 
         self.my_map = my_map
+        # compiled version of the map, shared by all the low-level searches
+        self.grid = Grid(my_map)
         self.starts = starts
         self.goals = goals
         self.num_of_agents = len(goals)
+        # both low-level searches take the same arguments and return shortest paths of the same cost (but not
+        # always the same paths, so the solvers can differ in the ties they break)
+        self.low_level = sipp if low_level == 'sipp' else a_star
 
         self.CPU_time = 0
 
         # compute heuristics for the low-level search
-        self.heuristics = []
-        for goal in self.goals:
-            self.heuristics.append(computeHeuristics(my_map, goal))
+        # the distance fields are shared with the other solvers through the heuristics cache
+        self.heuristics = getDistanceFields(self.grid, self.goals)
 
     def find_solution(self):
         """ Finds paths for all agents from their start locations to their goal locations."""
 
         start_time = timer.time()
         result = []
-        constraints = []      
+        # every planned path is committed into the shared reservation table, the goals are reserved indefinitely
+        reservations = ReservationTable(self.grid)
         
         for i in range(self.num_of_agents):  # Find path for each agent
             
-            path = a_star(self.my_map, self.starts[i], self.goals[i], self.heuristics[i],
-                          i, constraints)
+            path = self.low_level(self.grid, self.starts[i], self.goals[i], self.heuristics[i],
+                          i, reservations)
             # if no solution is found for this agent, return an empty list and do not attempt to solve for future agents
             # the empty list is used to detect that A* could not find solutions
             if path is None:
@@ -41,43 +51,10 @@ class PrioritizedPlanningSolver(object):
                 print('path none')
                 self.CPU_time = 0
                 return result, self.CPU_time
-                break
-            else:            
-            # path needs to be trimmed since constraints added for 200 future time steps will make paths unnecessarily long which will influence total cost
-            # paths where agent stays at same location for the remainder of time are trimmed
-                trim_length = 0
-                found = False
-                while found == False:
-                    if path[-trim_length-1] != path[-trim_length-2]:
-                        found = True
-                    else:
-                        trim_length += 1
 
-                path2 = path[:len(path)-trim_length]
-                result.append(path2)
-                # if the length of the path is very large, as agent has to wait very long, it is assumed no solution can be found and an empty list is returned
-                if len(path)> 500:
-                    result = []
-                    self.CPU_time = 0
-                    return result, self.CPU_time
-                    break
-
-            # for each agent after current agent        
-            for j in range(i+1,self.num_of_agents):
-                # for paths of all previous agents
-                for path in result:
-                    # for each location of previous agents
-                    for t in range(0,len(path)):
-                        # if the last location of that agent, implement constraint for next 100 time steps
-                        if  t == len(path)-1:
-                            for constraint_time in range(t,100):
-                                constraints.append({'agent': j,'loc': [path[t]],'timestep': constraint_time})
-                        # else implement for current time step
-                        else:
-                            constraints.append({'agent': j,'loc': [path[t]],'timestep': t})
-                        # if not the agents last point, implement an edge constraint as well
-                        if t < len(path)-1:
-                            constraints.append({'agent': j,'loc': [path[t+1],path[t]],'timestep': t+1})
+            # the low-level search stops as soon as the agent can stay at its goal, so the path needs no trimming
+            result.append(path)
+            reservations.reservePath(path)
 
         self.CPU_time = timer.time() - start_time
         
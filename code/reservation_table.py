@@ -0,0 +1,27 @@
+"""
+This file contains the ReservationTable class, a space-time reservation table shared by the agents of the prioritized planner.
+"""
+
+from single_agent_planner import ConstraintTable
+
+
+class ReservationTable(ConstraintTable):
+    """ Constraint table which is not bound to one agent: every planned path is committed into it once,
+        and the low-level searches of the following agents query it directly (see buildConstraintTable)
+    """
+
+    def reservePath(self, path, time = 0):
+        """ Reserves the cells and moves of a path, the last location (the goal) is reserved indefinitely
+
+        Args:
+            path (list): list of locations, starting at timestep time
+            time (int, optional): timestep of the first location of the path. Defaults to 0.
+        """
+        cells = [self.grid.cellId(loc) for loc in path]
+        for t, cell in enumerate(cells[:-1]):
+            self.addVertex(cell, time + t)
+            # other agents cannot swap locations with the agent
+            if cells[t + 1] != cell:
+                self.addEdge(cells[t + 1], cell, time + t + 1)
+        # the agent stays at its goal once it reached it
+        self.addPermanent(cells[-1], time + len(cells) - 1)
@@ -1,10 +1,7 @@
 import heapq
-
-
-def move(loc, dir):
-    # Included (0,0) direction to allow agents to wait in certain cell
-    directions = [(0, -1), (1, 0), (0, 1), (-1, 0), (0,0)]
-    return loc[0] + directions[dir][0], loc[1] + directions[dir][1]
+import math
+from grid import compileGrid
+from heuristics import computeDistanceFields
 
 
 def getSumOfCost(paths):
@@ -15,72 +12,204 @@ def getSumOfCost(paths):
 
 
 def computeHeuristics(my_map, goal):
-    # Use Dijkstra to build a shortest-path tree rooted at the goal location
-    open_list = []
-    closed_list = dict()
-    root = {'loc': goal, 'cost': 0}
-    heapq.heappush(open_list, (root['cost'], goal, root))
-    closed_list[goal] = root
-    while len(open_list) > 0:
-        (cost, loc, curr) = heapq.heappop(open_list)
-        for dir in range(4):
-            child_loc = move(loc, dir)
-            child_cost = cost + 1
-            if child_loc[0] < 0 or child_loc[0] >= len(my_map) \
-               or child_loc[1] < 0 or child_loc[1] >= len(my_map[0]):
-               continue
-            if my_map[child_loc[0]][child_loc[1]]:
-                continue
-            child = {'loc': child_loc, 'cost': child_cost}
-            if child_loc in closed_list:
-                existing_node = closed_list[child_loc]
-                if existing_node['cost'] > child_cost:
-                    closed_list[child_loc] = child
-                    # open_list.delete((existing_node['cost'], existing_node['loc'], existing_node))
-                    heapq.heappush(open_list, (child_cost, child_loc, child))
-            else:
-                closed_list[child_loc] = child
-                heapq.heappush(open_list, (child_cost, child_loc, child))
-
-    # build the heuristics table
-    h_values = dict()
-    for loc, node in closed_list.items():
-        h_values[loc] = node['cost']
-    return h_values
-
-
-def buildConstraintTable(constraints, agent):
+    # Breadth-first search from the goal location (all moves cost 1), see heuristics.computeDistanceFields
+    # returns a dense (rows x columns) array, np.inf marks the cells from which the goal cannot be reached
+    return computeDistanceFields(my_map, [goal])[0]
+
+
+class ConstraintTable(object):
+    """ Hash-indexed constraints of one agent. Vertex constraints are stored as packed integers
+        (t * num_cells + cell) and edge constraints as ((t * num_cells + from) * num_cells + to),
+        so every check in the low-level search is a single set lookup.
     """
-    Return a table that constains the list of constraints of
-                   the given agent for each time step. The table can be used
-                   for a more efficient constraint violation check in the 
-                   is_constrained function.
+
+    def __init__(self, grid):
+        """
+        Args:
+            grid (Grid): compiled map the cell ids refer to
+        """
+        self.grid = grid
+        self.num_cells = grid.num_cells
+        self.vertex = set()
+        self.edge = set()
+        # for each cell, the timesteps at which the agent is not allowed to be there
+        # used by the goal test and to derive the safe intervals of the cells
+        self.vertex_times = dict()
+        # for each cell, the timesteps t at which the agent is not allowed to wait there (from t-1 to t)
+        self.wait_times = dict()
+        # for each cell, the timestep from which on the agent is never allowed to be there again
+        self.permanent = dict()
+        # for each timestep, the cell in which the agent must be at that timestep (positive constraints)
+        # -1 if two positive constraints require different cells at the same timestep
+        self.positive = dict()
+        # the agent is not allowed to finish its path at or before this timestep (length constraints)
+        self.length = -1
+        # latest timestep with a constraint of any kind
+        self.max_time = 0
+
+
+    def addVertex(self, cell, t):
+        """ Forbids the agent to be in the cell at timestep t """
+        self.vertex.add(t * self.num_cells + cell)
+        self.vertex_times.setdefault(cell, set()).add(t)
+        self.max_time = max(self.max_time, t)
+
+
+    def addPermanent(self, cell, t):
+        """ Forbids the agent to be in the cell at timestep t and at any later timestep """
+        self.permanent[cell] = min(t, self.permanent.get(cell, math.inf))
+        self.max_time = max(self.max_time, t)
+
+
+    def addPositive(self, cell, t):
+        """ Forces the agent to be in the cell at timestep t """
+        self.positive[t] = cell if self.positive.get(t, cell) == cell else -1
+        self.max_time = max(self.max_time, t)
+
+
+    def addLength(self, t):
+        """ Forces the path of the agent to end after timestep t """
+        self.length = max(self.length, t)
+        self.max_time = max(self.max_time, t)
+
+
+    def addEdge(self, from_cell, to_cell, t):
+        """ Forbids the agent to move from from_cell (at t-1) to to_cell (at t) """
+        self.edge.add((t * self.num_cells + from_cell) * self.num_cells + to_cell)
+        if from_cell == to_cell:
+            self.wait_times.setdefault(from_cell, set()).add(t)
+        self.max_time = max(self.max_time, t)
+
+
+    def isConstrained(self, curr_cell, next_cell, next_time):
+        """ Returns True if the move from curr_cell to next_cell, arriving at next_time, violates a constraint """
+        key = next_time * self.num_cells
+        return key + next_cell in self.vertex or (key + curr_cell) * self.num_cells + next_cell in self.edge \
+               or next_time >= self.permanent.get(next_cell, math.inf) or self.positive.get(next_time, next_cell) != next_cell
+
+
+    def latestConstraint(self, cell):
+        """ Returns the latest timestep at which the agent is not allowed to be (or wait) in the cell (-1 if there is none, math.inf if it is blocked permanently) """
+        # an agent can only stay at its goal after the last constraint on it, never if the cell is blocked permanently
+        if cell in self.permanent:
+            return math.inf
+        # a wait constraint at t only forbids to be in the cell at both t-1 and t, arriving at t is allowed
+        return max(max(self.vertex_times.get(cell, ()), default=-1), max(self.wait_times.get(cell, ()), default=0) - 1)
+
+
+    def latestPositive(self, cell):
+        """ Returns the latest timestep at which the agent must be in another cell than the given one (-1 if there is none) """
+        # the agent cannot stop at its goal before it has satisfied all the positive constraints elsewhere
+        return max((t for t, positive_cell in self.positive.items() if positive_cell != cell), default=-1)
+
+
+    def latestGoalConstraint(self, goal_cell):
+        """ Returns the latest timestep at which the agent cannot finish its path at its goal: the agent has to respect
+            the constraints on the goal cell and the positive constraints elsewhere, and the path has to be long enough
+            The negative constraints on the other cells are ignored: an agent which stays at its goal can never violate
+            them. (The list-based table made the agent wait until after the last constraint of any cell, which gave
+            paths longer than the shortest ones under the constraints, and solutions above the optimal sum of costs)
+        """
+        return max(self.latestConstraint(goal_cell), self.latestPositive(goal_cell), self.length)
+
+
+    def safeIntervals(self, cell):
+        """ Returns the safe intervals of the cell: the maximal [start, end] periods in which the agent
+            is allowed to stay in the cell, sorted by time. The last interval never ends (end is math.inf)
+            An interval is also split where waiting is forbidden, the agent can only enter the second part from another cell
+        """
+        intervals = []
+        start = 0
+        for t in sorted(self.vertex_times.get(cell, ())):
+            if t > start:
+                intervals.append((start, t - 1))
+            start = t + 1
+        intervals.append((start, math.inf))
+
+        for t in sorted(self.wait_times.get(cell, ())):
+            for i, (start, end) in enumerate(intervals):
+                if start < t <= end:
+                    intervals[i:i + 1] = [(start, t - 1), (t, end)]
+                    break
+
+        # the intervals are cut where the cell becomes blocked permanently
+        if cell in self.permanent:
+            intervals = [(start, min(end, self.permanent[cell] - 1)) for (start, end) in intervals if start < self.permanent[cell]]
+        return intervals
+
+
+def buildConstraintTable(constraints, agent, grid):
     """
-    constraint_table = []
-    max_time = 0
+    Return a ConstraintTable that contains the constraints of the given agent,
+                   indexed by cell and timestep for O(1) lookups in the
+                   isConstrained function.
+                   If constraints already is a table (e.g. a shared ReservationTable), it is used as is.
+                   A positive constraint ('positive': True) forces its agent to be at the location (or to traverse
+                   the edge) at the timestep, and forbids all the other agents to be there at the same time.
+                   The constraints of symmetry reasoning are expanded into vertex constraints:
+                   'type': 'range' forbids the location during the timesteps (start, end) of the constraint and
+                   'type': 'barrier' forbids the i-th location of the constraint at timestep + i.
+                   Target reasoning adds two more types: 'type': 'length' forces the path of the agent to end after
+                   the timestep and 'type': 'target' forbids the location at the timestep and at any later timestep.
+    """
+    if isinstance(constraints, ConstraintTable):
+        return constraints
+
+    constraint_table = ConstraintTable(grid)
 
     # for each constraint in the list of constraints:
     for constraint in constraints:  
+        positive = constraint.get("positive", False)
+        # only the constraints of the current agent and the positive constraints of the other agents matter
+        if constraint["agent"] != agent and not positive:
+            continue
+        # constraints on locations which are not free cells of the map can never be violated, so they are skipped
+        # (the locations of a barrier are independent of each other, only the ones which are not free are skipped)
+        cells = [grid.cellId(loc) for loc in constraint["loc"]]
+        if -1 in cells and constraint.get("type") != "barrier":
+            continue
+        t = constraint["timestep"]
+
         # if the constraint in the list is intended for the current agent:      
         if constraint["agent"] == agent:
-            # add the constraint location and timestep into the temporary constraint table for this agent
-            constraint_table.append([constraint["loc"],constraint["timestep"]])
-            # if the constraint time is larger than the current indentified max timestep for any constraint, update the max time 
-            if constraint["timestep"] >= max_time:
-               max_time = constraint["timestep"]
-    
- 
-    indexed_constraint_table = []
-    # create indexed constraint table with length of largest constraint timestep
-    for i in range(max_time+1):
-        indexed_constraint_table.append([])
-    
-    # for each constraint identified for this agent:
-    for constraint in constraint_table:
-        # insert constraint's location at the constraints timestep
-        indexed_constraint_table[constraint[1]].append(constraint[0])    
+            # range constraint
+            if constraint.get("type") == "range":
+                for range_t in range(t[0], t[1] + 1):
+                    constraint_table.addVertex(cells[0], range_t)
+            # length constraint
+            elif constraint.get("type") == "length":
+                constraint_table.addLength(t)
+            # target constraint
+            elif constraint.get("type") == "target":
+                constraint_table.addPermanent(cells[0], t)
+            # barrier constraint
+            elif constraint.get("type") == "barrier":
+                for i, cell in enumerate(cells):
+                    if cell != -1:
+                        constraint_table.addVertex(cell, t + i)
+            # positive vertex constraint
+            elif positive and len(cells) == 1:
+                constraint_table.addPositive(cells[0], t)
+            # positive edge constraint: the agent is at the first location at t-1 and at the second one at t
+            elif positive and len(cells) == 2:
+                constraint_table.addPositive(cells[0], t - 1)
+                constraint_table.addPositive(cells[1], t)
+            # vertex constraint
+            elif len(cells) == 1:
+                constraint_table.addVertex(cells[0], t)
+            # edge constraint
+            elif len(cells) == 2:
+                constraint_table.addEdge(cells[0], cells[1], t)
+        # a positive constraint of another agent: the current agent cannot be at the same location at the same time
+        elif len(cells) == 1:
+            constraint_table.addVertex(cells[0], t)
+        # a positive edge constraint of another agent: the current agent cannot use any of its locations or swap with it
+        else:
+            constraint_table.addVertex(cells[0], t - 1)
+            constraint_table.addVertex(cells[1], t)
+            constraint_table.addEdge(cells[1], cells[0], t)
    
-    return indexed_constraint_table
+    return constraint_table
 
 
 def getLocation(path, time):
@@ -92,108 +221,102 @@ def getLocation(path, time):
         return path[-1]  # wait at the goal location
 
 
-def getPath(goal_node):
+def getPath(goal_node, node_cell, node_parent, grid):
+    """ Rebuilds the path ending in goal_node by following the parent indices of the node store """
     path = []
     curr = goal_node
-    while curr is not None:
-        path.append(curr['loc'])
-        curr = curr['parent']
+    while curr != -1:
+        path.append(grid.locations[node_cell[curr]])
+        curr = node_parent[curr]
     path.reverse()
     return path
 
 
-def isConstrained(curr_loc, next_loc, next_time, constraint_table):
-    constrained = False
-    
-    # check for times earlier than the latest constraint
-    if next_time < len(constraint_table):   
-        # check each constraint for agent at next time
-        for constraint in constraint_table[next_time]:
-            # if constraint saved as a vertex constraint
-            if len(constraint) == 1:
-                # if constraint location equals next location
-                if constraint[0] == next_loc:
-                    constrained = True
-            # if constraint is saved as a edge constraint
-            if len(constraint) == 2:
-                # if current and next location match constraint locations
-                if constraint[0] == curr_loc and constraint[1] == next_loc:
-                    constrained = True
-                              
-    return constrained
-
-
-def pushNode(open_list, node):
-    heapq.heappush(open_list, (node['g_val'] + node['h_val'], node['h_val'], node['loc'], node))
-
-
-def popNode(open_list):
-    _, _, _, curr = heapq.heappop(open_list)
-    return curr
-
-
-def compareNodes(n1, n2):
-    """Return true if n1 is better than n2."""
-    return n1['g_val'] + n1['h_val'] < n2['g_val'] + n2['h_val']
+def isConstrained(curr_cell, next_cell, next_time, constraint_table):
+    # the constraint table hashes the constraints by cell and timestep, see ConstraintTable
+    return constraint_table.isConstrained(curr_cell, next_cell, next_time)
 
 
 def a_star(my_map, start_loc, goal_loc, h_values, agent, constraints, time = 0, distributed = False):
-    """ my_map      - binary obstacle map
+    """ my_map      - binary obstacle map (or its compiled Grid)
         start_loc   - start position
         goal_loc    - goal position
+        h_values    - heuristic values indexed by location, or the list indexed by cell id (see Grid.cellValues)
         agent       - the ID of the agent that is being re-planned
         constraints - constraints defining where robot should or cannot go at each timestep
     """
 
-    open_list = []
-    closed_list = dict()
-    earliest_goal_timestep = 0
-    h_value = h_values[start_loc]
+    grid = compileGrid(my_map)
+    offsets, neighbours = grid.offsets, grid.neighbours
+    num_cells = grid.num_cells
+    # heuristic values indexed by cell id, the solvers which plan an agent many times convert them once
+    h_cells = h_values if isinstance(h_values, list) else grid.cellValues(h_values)
+    goal_cell = grid.cellId(goal_loc)
+    start_cell = grid.cellId(start_loc)
+    h_value = h_cells[start_cell]
+    # the goal cannot be reached from the start location
+    if h_value is None:
+        return None
     
     # build constraint table for this agent
-    indexed_constraint_table = buildConstraintTable(constraints, agent)
-    
-    
+    constraint_table = buildConstraintTable(constraints, agent, grid)
+    vertex_constraints, edge_constraints = constraint_table.vertex, constraint_table.edge
+    permanent_constraints = constraint_table.permanent
+    positive_constraints = constraint_table.positive
+    # the agent can only stay at its goal once the last constraint on the goal cell has passed,
+    # once it has been everywhere the positive constraints force it to be and once its path is long enough
+    latest_goal_constraint = constraint_table.latestGoalConstraint(goal_cell)
+    # after the last constraint the map no longer changes, so if the goal can still be reached it is reached
+    # within num_cells more timesteps; nodes after this horizon are not expanded, such that the search always ends
+    horizon = max(constraint_table.max_time, time) + num_cells
+
+    # compact node store: node i is described by the i-th entry of each of the parallel lists below
+    # the parent is stored as the index of the parent node (-1 for the root)
+    node_cell = [start_cell]
+    node_time = [time]
+    node_parent = [-1]
 
-    root = {'loc': start_loc, 'g_val': 0, 'h_val': h_value, 'parent': None, 't_step':time}
-    pushNode(open_list, root)
-    closed_list[(root['loc'],root['t_step'])] = root
+    # the open list holds (f, h, cell, node index) tuples
+    open_list = [(h_value, h_value, start_cell, 0)]
+    # (cell, timestep) pairs which were already generated, packed as t * num_cells + cell
+    # all moves cost 1, so a pair generated again can never have a lower cost than the first time
+    closed_list = {time * num_cells + start_cell}
     while len(open_list) > 0:
-        curr = popNode(open_list)
+        _, _, curr_cell, curr = heapq.heappop(open_list)
+        curr_time = node_time[curr]
         
-        # if agent has reached goal location and there are no constraints posed on agent at a later time:
+        # if agent has reached goal location and no constraint prevents it from staying there, see latestGoalConstraint
         # in the case of the distributed solver, once the goal is reached, the path is returned, further constraints are ignored     
-        if curr['loc'] == goal_loc and len(getPath(curr)) >= len(indexed_constraint_table) and distributed == False:
-            return getPath(curr)
+        if curr_cell == goal_cell and curr_time > latest_goal_constraint and distributed == False:
+            return getPath(curr, node_cell, node_parent, grid)
 
-        elif curr['loc'] == goal_loc and distributed == True and not isConstrained(curr['loc'], curr['loc'], curr['t_step']+1, indexed_constraint_table):
+        elif curr_cell == goal_cell and distributed == True and not isConstrained(curr_cell, curr_cell, curr_time+1, constraint_table):
         
-            return getPath(curr)
+            return getPath(curr, node_cell, node_parent, grid)
 
-        for dir in range(5):
-            child_loc = move(curr['loc'], dir)            
-            # if child location is outside of map
-            if child_loc[0] < 0 or child_loc[1] < 0 or child_loc[0] >= len(my_map) or child_loc[1] >= len(my_map[0]):
+        if curr_time >= horizon:
+            continue
+
+        child_time = curr_time + 1
+        child_g = child_time - time
+        time_key = child_time * num_cells
+        # the neighbouring free cells (wait move included) are read from the precomputed adjacency array
+        for i in range(offsets[curr_cell], offsets[curr_cell + 1]):
+            child_cell = neighbours[i]
+            child_h = h_cells[child_cell]
+            child_key = time_key + child_cell
+            # if the goal cannot be reached from the cell, the node was already generated or the move is constrained
+            if child_h is None or child_key in closed_list or child_key in vertex_constraints \
+               or (time_key + curr_cell) * num_cells + child_cell in edge_constraints \
+               or child_time >= permanent_constraints.get(child_cell, math.inf) \
+               or positive_constraints.get(child_time, child_cell) != child_cell:
                 continue
-            # if child location is a blocked cell or the cell is constrained
-            if my_map[child_loc[0]][child_loc[1]] or isConstrained(curr['loc'], child_loc, curr['t_step']+1, indexed_constraint_table): 
-                continue            
-    
-            child = {'loc': child_loc,
-                    'g_val': curr['g_val'] + 1,
-                    'h_val': h_values[child_loc],
-                    'parent': curr,
-                    't_step': curr['t_step'] + 1}           
-             
-            
-            if (child['loc'],child['t_step']) in closed_list :
-                existing_node = closed_list[(child['loc'],child['t_step'])]
-                if compareNodes(child, existing_node):
-                    closed_list[(child['loc'],child['t_step'])] = child
-                    pushNode(open_list, child)
-            else:
-                closed_list[(child['loc'],child['t_step'])] = child
-                pushNode(open_list, child)
+
+            closed_list.add(child_key)
+            node_cell.append(child_cell)
+            node_time.append(child_time)
+            node_parent.append(curr)
+            heapq.heappush(open_list, (child_g + child_h, child_h, child_cell, len(node_cell) - 1))
 
    
     return None  # Failed to find solutions
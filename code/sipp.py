@@ -0,0 +1,137 @@
+"""
+This file contains the Safe Interval Path Planning (SIPP) low-level search, an alternative to the time-expanded A*.
+SIPP searches over (cell, safe interval) pairs instead of (cell, timestep) pairs, so waiting does not create new
+search nodes and the search effort depends on the number of safe intervals instead of on the duration of the path.
+Its paths have the same cost as the ones of A*, but where several shortest paths exist it can return another one.
+"""
+
+import heapq
+import math
+from grid import compileGrid
+from single_agent_planner import a_star, buildConstraintTable
+
+
+def getIntervalPath(goal_node, node_cell, node_time, node_parent, grid):
+    """ Rebuilds the path ending in goal_node, the agent waits in each cell until it moves into the next one
+
+    Args:
+        goal_node (int): index of the goal node in the node store
+        node_cell, node_time, node_parent (list): node store, see sipp
+        grid (Grid): compiled map
+    """
+    nodes = []
+    curr = goal_node
+    while curr != -1:
+        nodes.append(curr)
+        curr = node_parent[curr]
+    nodes.reverse()
+
+    path = []
+    for node, next_node in zip(nodes, nodes[1:]):
+        # the agent stays in the cell from its arrival until the move into the next cell
+        path.extend([grid.locations[node_cell[node]]] * (node_time[next_node] - node_time[node]))
+    path.append(grid.locations[node_cell[goal_node]])
+    return path
+
+
+def sipp(my_map, start_loc, goal_loc, h_values, agent, constraints, time = 0):
+    """ my_map      - binary obstacle map (or its compiled Grid)
+        start_loc   - start position
+        goal_loc    - goal position
+        h_values    - heuristic values indexed by location, or the list indexed by cell id (see Grid.cellValues)
+        agent       - the ID of the agent that is being re-planned
+        constraints - constraints defining where robot should or cannot go at each timestep
+        Returns a path of the same cost as the one of a_star (not always the same path), a list of locations starting
+        at timestep time (None if there is no path)
+    """
+
+    grid = compileGrid(my_map)
+    offsets, neighbours = grid.offsets, grid.neighbours
+    # heuristic values indexed by cell id
+    h_cells = h_values if isinstance(h_values, list) else grid.cellValues(h_values)
+    goal_cell = grid.cellId(goal_loc)
+    start_cell = grid.cellId(start_loc)
+    h_value = h_cells[start_cell]
+    # the goal cannot be reached from the start location
+    if h_value is None:
+        return None
+
+    # build constraint table for this agent, the safe intervals of the cells are derived from it when they are first needed
+    constraint_table = buildConstraintTable(constraints, agent, grid)
+    # positive constraints pin the agent to single timesteps, which do not fit the safe intervals, A* handles them
+    if len(constraint_table.positive) > 0:
+        return a_star(grid, start_loc, goal_loc, h_cells, agent, constraint_table, time)
+    safe_intervals = dict()
+    def getSafeIntervals(cell):
+        if cell not in safe_intervals:
+            safe_intervals[cell] = constraint_table.safeIntervals(cell)
+        return safe_intervals[cell]
+
+    # the search starts in the safe interval of the start cell which contains the start time. Like a_star, the
+    # constraints on the start cell at the start time are ignored: the agent is already there, in a single timestep
+    # interval (-1) from which it moves on or waits into the next safe interval of the cell
+    start_interval = -1
+    for i, (interval_start, interval_end) in enumerate(getSafeIntervals(start_cell)):
+        if interval_start <= time <= interval_end:
+            start_interval = i
+    def intervalEnd(cell, interval):
+        return time if interval == -1 else getSafeIntervals(cell)[interval][1]
+
+    # compact node store: node i is described by the i-th entry of each of the parallel lists below
+    # the time of a node is the (earliest) timestep at which the agent arrives in the cell
+    node_cell = [start_cell]
+    node_interval = [start_interval]
+    node_time = [time]
+    node_parent = [-1]
+
+    # earliest arrival time found so far for each (cell, safe interval) state
+    best_arrival = {(start_cell, start_interval): time}
+    # the open list holds (f, h, cell, node index) tuples
+    open_list = [(h_value, h_value, start_cell, 0)]
+    while len(open_list) > 0:
+        _, _, curr_cell, curr = heapq.heappop(open_list)
+        curr_time = node_time[curr]
+        # a better arrival in the same safe interval was found after this node was pushed
+        if best_arrival[(curr_cell, node_interval[curr])] < curr_time:
+            continue
+
+        # the agent can stay at its goal forever only in the last safe interval, which never ends
+        curr_interval_end = intervalEnd(curr_cell, node_interval[curr])
+        if curr_cell == goal_cell and curr_interval_end == math.inf:
+            path = getIntervalPath(curr, node_cell, node_time, node_parent, grid)
+            # a path which has to be longer (length constraint) waits at the goal, which is free until the end
+            path.extend([goal_loc] * (constraint_table.length + 1 - (time + len(path) - 1)))
+            return path
+
+        # waiting is implicit in the safe intervals, so the wait move (the last neighbour) is skipped, except out of the
+        # single timestep start interval
+        last_neighbour = offsets[curr_cell + 1] if node_interval[curr] == -1 else offsets[curr_cell + 1] - 1
+        for i in range(offsets[curr_cell], last_neighbour):
+            child_cell = neighbours[i]
+            child_h = h_cells[child_cell]
+            if child_h is None:
+                continue
+
+            for child_interval, (interval_start, interval_end) in enumerate(getSafeIntervals(child_cell)):
+                # the agent can wait in the current cell until the end of its safe interval
+                if interval_start > curr_interval_end + 1:
+                    break
+                arrival = max(curr_time + 1, interval_start)
+                # the move is delayed as long as the edge is constrained
+                while arrival <= min(curr_interval_end + 1, interval_end) \
+                      and constraint_table.isConstrained(curr_cell, child_cell, arrival):
+                    arrival += 1
+                if arrival > min(curr_interval_end + 1, interval_end):
+                    continue
+
+                state = (child_cell, child_interval)
+                if state in best_arrival and best_arrival[state] <= arrival:
+                    continue
+                best_arrival[state] = arrival
+                node_cell.append(child_cell)
+                node_interval.append(child_interval)
+                node_time.append(arrival)
+                node_parent.append(curr)
+                heapq.heappush(open_list, (arrival - time + child_h, child_h, child_cell, len(node_cell) - 1))
+
+    return None  # Failed to find solutions
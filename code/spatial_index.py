@@ -0,0 +1,67 @@
+"""
+This file contains the spatial index of the agents of the distributed planner.
+The map is divided in square buckets as large as the radar radius, such that the agents within the radius of a
+location are all in the bucket of the location or in one of its 8 neighbouring buckets.
+"""
+
+import math
+
+
+class SpatialIndex(object):
+    """ Uniform bucket grid of the agent locations, updated as the agents move """
+
+    def __init__(self, radius):
+        """
+        Args:
+            radius (float): the radius of the queries, the side of the buckets
+        """
+        self.radius = radius
+        self.bucket_size = max(1, math.ceil(radius))
+        # bucket (bx, by) -> set of the ids of the agents in the bucket
+        self.buckets = dict()
+        # agent id -> location of the agent
+        self.locations = dict()
+
+
+    def bucket(self, location):
+        """ Returns the bucket of a location """
+        return location[0] // self.bucket_size, location[1] // self.bucket_size
+
+
+    def insert(self, agent_id, location):
+        """ Adds an agent at its location """
+        self.locations[agent_id] = location
+        self.buckets.setdefault(self.bucket(location), set()).add(agent_id)
+
+
+    def move(self, agent_id, location):
+        """ Moves an agent to a new location, it only changes bucket when it crosses the border of its bucket """
+        old_bucket = self.bucket(self.locations[agent_id])
+        new_bucket = self.bucket(location)
+        self.locations[agent_id] = location
+        if old_bucket != new_bucket:
+            self.buckets[old_bucket].discard(agent_id)
+            if len(self.buckets[old_bucket]) == 0:
+                del self.buckets[old_bucket]
+            self.buckets.setdefault(new_bucket, set()).add(agent_id)
+
+
+    def query(self, location):
+        """ Returns the ids of the agents at a (euclidian) distance smaller than the radius from the location, in
+            increasing order
+
+        Args:
+            location (tuple): the centre of the query
+        """
+        bx, by = self.bucket(location)
+        radius_squared = self.radius * self.radius
+        found = []
+        for x in range(bx - 1, bx + 2):
+            for y in range(by - 1, by + 2):
+                for agent_id in self.buckets.get((x, y), ()):
+                    other = self.locations[agent_id]
+                    dx, dy = other[0] - location[0], other[1] - location[1]
+                    if dx * dx + dy * dy < radius_squared:
+                        found.append(agent_id)
+        found.sort()
+        return found
@@ -0,0 +1,204 @@
+"""
+This file contains the symmetry reasoning of CBS: target, corridor and rectangle conflicts.
+With standard splitting, an agent which runs into another agent parked at its goal, two agents which meet
+head-on in a corridor, or two agents whose shortest paths cross in an open rectangle need many high-level nodes
+before CBS proves that one of them has to wait or make a detour. These conflicts are resolved in a single split
+instead, with length and target constraints (targets), range constraints (corridors) or barrier constraints
+(rectangles). Every solution satisfies at least one of the two constraints, so CBS remains optimal.
+"""
+
+import math
+from heuristics import computeDistanceFields, getDistanceFields
+from single_agent_planner import getLocation
+
+
+def manhattan(loc1, loc2):
+    return abs(loc1[0] - loc2[0]) + abs(loc1[1] - loc2[1])
+
+
+def sign(value):
+    return (value > 0) - (value < 0)
+
+
+class SymmetryReasoner(object):
+    """ Detects the target, corridor and rectangle conflicts of a pair of agents and returns the constraints resolving them """
+
+    def __init__(self, grid, starts, goals):
+        """
+        Args:
+            grid (Grid): compiled map
+            starts, goals (list): start and goal locations of the agents
+        """
+        self.grid = grid
+        self.starts = starts
+        self.goals = goals
+        # distances from every cell to an endpoint when the corridor is blocked (the bypasses), by (corridor, endpoint)
+        self.bypass_fields = dict()
+
+
+    def symmetryConstraints(self, collision, paths):
+        """ Returns the two constraints resolving the collision if it is a target, corridor or rectangle conflict, None otherwise
+
+        Args:
+            collision (dict): {'a1', 'a2', 'loc', 'timestep'} as returned by detectCollisions
+            paths (list): current paths of the agents
+        """
+        constraints = None
+        if len(collision['loc']) == 1:
+            constraints = self.targetConstraints(collision, paths)
+        if constraints is None:
+            constraints = self.corridorConstraints(collision, paths)
+        if constraints is None and len(collision['loc']) == 1:
+            constraints = self.rectangleConstraints(collision, paths)
+        return constraints
+
+
+    def targetConstraints(self, collision, paths):
+        """ Returns the length and target constraints resolving a collision with an agent parked at its goal, None if there is none
+
+        Agent i has finished its path at its goal g at timestep t, agent j is at g at timestep t. Either the path of i
+        ends after t (length constraint), or i stays at g from t on, and then j is never at g at t or later (target constraint).
+        """
+        loc, t = collision['loc'][0], collision['timestep']
+        for i, j in ((collision['a1'], collision['a2']), (collision['a2'], collision['a1'])):
+            if loc == self.goals[i] and t >= len(paths[i]) - 1:
+                return [{'agent': i, 'loc': [loc], 'timestep': t, 'type': 'length'},
+                        {'agent': j, 'loc': [loc], 'timestep': t, 'type': 'target'}]
+        return None
+
+
+    def degree(self, cell):
+        # number of free neighbouring cells (the wait move is the last neighbour and is not counted)
+        return self.grid.offsets[cell + 1] - self.grid.offsets[cell] - 1
+
+
+    def corridor(self, cell):
+        """ Returns the cells of the corridor (maximal chain of cells with two free neighbours) containing the cell,
+            ordered from one endpoint to the other, None if the cell is not in a corridor
+        """
+        grid = self.grid
+        if self.degree(cell) != 2:
+            return None
+        chain = [cell]
+        visited = {cell}
+        for side in range(2):
+            # walk from the cell towards each of its two neighbours while the cells have two free neighbours
+            prev, curr = cell, grid.neighbours[grid.offsets[cell] + side]
+            while curr not in visited and self.degree(curr) == 2:
+                visited.add(curr)
+                if side == 0:
+                    chain.insert(0, curr)
+                else:
+                    chain.append(curr)
+                # the next cell is the neighbour the walk does not come from
+                next_cell = [n for n in grid.neighbours[grid.offsets[curr]:grid.offsets[curr + 1] - 1] if n != prev][0]
+                prev, curr = curr, next_cell
+        return chain
+
+
+    def bypassDistance(self, corridor, endpoint, start):
+        """ Returns the length of the shortest path from start to the endpoint which does not go through the corridor """
+        key = (corridor[0], corridor[-1], endpoint)
+        if key not in self.bypass_fields:
+            blocked_map = [row.copy() for row in self.grid.my_map]
+            for cell in corridor:
+                if cell != endpoint:
+                    x, y = self.grid.locations[cell]
+                    blocked_map[x][y] = True
+            self.bypass_fields[key] = computeDistanceFields(blocked_map, [self.grid.locations[endpoint]])[0]
+        return self.bypass_fields[key][start]
+
+
+    def corridorConstraints(self, collision, paths):
+        """ Returns the range constraints resolving a head-on collision in a corridor, None if there is none
+
+        The corridor has the endpoints e1 and e2 at distance k. If a1 reaches e2 from e1 and a2 reaches e1 from e2,
+        one of them waits until the other has left the corridor. So either a1 is not at e2 before t2(e1) + k + 1
+        or a2 is not at e1 before t1(e2) + k + 1, with t(e) a lower bound of the arrival time of the agent at e.
+        An agent which reaches the far endpoint through a bypass only arrives at t'(e), so the ranges end at t'(e) - 1.
+        """
+        grid = self.grid
+        a1, a2 = collision['a1'], collision['a2']
+        corridor = None
+        for loc in collision['loc']:
+            corridor = self.corridor(grid.cellId(loc))
+            if corridor is not None:
+                break
+        if corridor is None or len(corridor) < 2:
+            return None
+        # agents which start in the corridor do not necessarily enter it through an endpoint
+        corridor_locations = {grid.locations[cell] for cell in corridor}
+        if self.starts[a1] in corridor_locations or self.starts[a2] in corridor_locations:
+            return None
+
+        k = len(corridor) - 1
+        for e1, e2 in ((corridor[0], corridor[-1]), (corridor[-1], corridor[0])):
+            e1_loc, e2_loc = grid.locations[e1], grid.locations[e2]
+            # lower bounds of the arrival times: the distances on the map without any constraint
+            t1_e2 = getDistanceFields(grid, [e2_loc])[0][self.starts[a1]]
+            t2_e1 = getDistanceFields(grid, [e1_loc])[0][self.starts[a2]]
+            end1 = min(t2_e1 + k, self.bypassDistance(corridor, e2, self.starts[a1]) - 1)
+            end2 = min(t1_e2 + k, self.bypassDistance(corridor, e1, self.starts[a2]) - 1)
+            # ranges which are empty (or never end, because an endpoint cannot be reached) are not used
+            if not (0 <= end1 < math.inf and 0 <= end2 < math.inf):
+                continue
+            end1, end2 = int(end1), int(end2)
+
+            # the split only helps if the current paths of both agents violate their range constraint
+            if any(getLocation(paths[a1], t) == e2_loc for t in range(end1 + 1)) \
+               and any(getLocation(paths[a2], t) == e1_loc for t in range(end2 + 1)):
+                return [{'agent': a1, 'loc': [e2_loc], 'timestep': (0, end1), 'type': 'range'},
+                        {'agent': a2, 'loc': [e1_loc], 'timestep': (0, end2), 'type': 'range'}]
+        return None
+
+
+    def rectangleConstraints(self, collision, paths):
+        """ Returns the barrier constraints resolving a rectangle conflict, None if there is none
+
+        Both agents follow Manhattan-optimal paths in the same directions and collide in the rectangle spanned by
+        Rs (the start corner, the latest of the two starts) and Rg (the goal corner, the earliest of the two goals).
+        If the first agent crosses the rectangle from its Rs.x side to its Rg.x side and the second one from its Rs.y
+        side to its Rg.y side, their Manhattan-optimal paths through the rectangle always collide. So either the first
+        agent is not on the Rg.x border of the rectangle at its Manhattan time or the second agent is not on the Rg.y border.
+        """
+        a1, a2 = collision['a1'], collision['a2']
+        loc, t = collision['loc'][0], collision['timestep']
+        starts = [self.starts[a1], self.starts[a2]]
+        goals = [self.goals[a1], self.goals[a2]]
+        for agent, start, goal in zip((a1, a2), starts, goals):
+            # the paths are Manhattan-optimal and both agents reach the collision location at their Manhattan time
+            if len(paths[agent]) - 1 != manhattan(start, goal) or manhattan(start, loc) != t:
+                return None
+
+        # the agents move in the same directions, the coordinates are flipped such that both of them increase
+        directions = []
+        for axis in range(2):
+            moves = {sign(goal[axis] - start[axis]) for start, goal in zip(starts, goals)} - {0}
+            if len(moves) > 1:
+                return None
+            directions.append(moves.pop() if len(moves) > 0 else 1)
+        def flip(loc):
+            return (loc[0] * directions[0], loc[1] * directions[1])
+        s1, s2 = flip(starts[0]), flip(starts[1])
+        g1, g2 = flip(goals[0]), flip(goals[1])
+        rs = (max(s1[0], s2[0]), max(s1[1], s2[1]))
+        rg = (min(g1[0], g2[0]), min(g1[1], g2[1]))
+        if rs[0] > rg[0] or rs[1] > rg[1]:
+            return None
+
+        # one agent spans the rectangle along the first axis, the other one along the second axis
+        if s1[1] == rs[1] and g1[1] == rg[1] and s2[0] == rs[0] and g2[0] == rg[0]:
+            first, second = (a1, s1), (a2, s2)
+        elif s2[1] == rs[1] and g2[1] == rg[1] and s1[0] == rs[0] and g1[0] == rg[0]:
+            first, second = (a2, s2), (a1, s1)
+        else:
+            return None
+
+        # barrier of the first agent: the border x = Rg.x, from y = Rs.y to Rg.y, at the Manhattan times of the first agent
+        # barrier of the second agent: the border y = Rg.y, from x = Rs.x to Rg.x, at the Manhattan times of the second agent
+        agent1, start1 = first
+        agent2, start2 = second
+        barrier1 = [flip((rg[0], y)) for y in range(rs[1], rg[1] + 1)]
+        barrier2 = [flip((x, rg[1])) for x in range(rs[0], rg[0] + 1)]
+        return [{'agent': agent1, 'loc': barrier1, 'timestep': manhattan(start1, (rg[0], rs[1])), 'type': 'barrier'},
+                {'agent': agent2, 'loc': barrier2, 'timestep': manhattan(start2, (rs[0], rg[1])), 'type': 'barrier'}]
@@ -0,0 +1,87 @@
+"""
+Regression tests of CBS: the solutions of the test instances have the minimal sum of costs of
+instances/min-sum-of-cost.csv and no collisions, also when the duplicate nodes of the CBS tree are pruned.
+Run with python -m pytest from the code folder.
+"""
+
+import csv
+import os
+import pytest
+from cbs import CBSSolver, detectCollisions
+from persistent import ConstraintChain
+from single_agent_planner import getSumOfCost
+from utilities import import_mapf_instance
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def loadCosts():
+    """ Returns the (instance file, minimal sum of costs) pairs of the test instances """
+    with open(os.path.join(CODE_DIR, 'instances', 'min-sum-of-cost.csv')) as f:
+        return [(os.path.join(CODE_DIR, filename), int(cost)) for filename, cost in csv.reader(f)]
+
+
+@pytest.mark.parametrize('filename, cost', loadCosts(), ids=lambda value: os.path.basename(str(value)))
+def test_disjoint_splitting(filename, cost):
+    """ CBS with disjoint splitting finds a solution of minimal sum of costs """
+    my_map, starts, goals = import_mapf_instance(filename)
+    paths, _ = CBSSolver(my_map, starts, goals).findSolution(disjoint=True)
+    assert len(paths) == len(goals)
+    assert len(detectCollisions(paths)) == 0
+    assert getSumOfCost(paths) == cost
+
+
+class UnprunedCBSSolver(CBSSolver):
+    """ CBS which keeps the children with the same constraints as an earlier node """
+
+    def isNewNode(self, node):
+        return True
+
+
+def test_duplicate_nodes_pruned():
+    """ A node with the same constraints as an earlier one (in any order) is pruned, the other nodes are kept """
+    my_map, starts, goals = import_mapf_instance(os.path.join(CODE_DIR, 'instances', 'test_1.txt'))
+    solver = CBSSolver(my_map, starts, goals)
+    root = ConstraintChain()
+    first = {'agent': 0, 'loc': [(1, 2)], 'timestep': 3}
+    second = {'agent': 1, 'loc': [(1, 2)], 'timestep': 3}
+    assert solver.isNewNode({'constraints': root.add(first).add(second)})
+    assert not solver.isNewNode({'constraints': root.add(second).add(first)})
+    assert solver.isNewNode({'constraints': root.add(first)})
+    assert solver.num_of_duplicates == 1
+
+    # with merging, the nodes with the same constraints but other meta-agents are kept
+    solver = CBSSolver(my_map, starts, goals, merge_threshold=1)
+    constraints = root.add(first)
+    assert solver.isNewNode({'constraints': constraints, 'meta_agents': [(0,), (1,)]})
+    assert solver.isNewNode({'constraints': constraints, 'meta_agents': [(0, 1), (0, 1)]})
+    assert not solver.isNewNode({'constraints': constraints, 'meta_agents': [(0, 1), (0, 1)]})
+
+
+@pytest.mark.parametrize('filename, cost', [(os.path.join(CODE_DIR, 'instances', 'test_41.txt'), 45),
+                                            (os.path.join(CODE_DIR, 'instances', 'test_47.txt'), 65)],
+                         ids=lambda value: os.path.basename(str(value)))
+def test_pruning_keeps_optimal_solution(filename, cost):
+    """ The pruned duplicate nodes never cut off the optimal solution: CBS with and without pruning find the same
+        minimal sum of costs
+    """
+    my_map, starts, goals = import_mapf_instance(filename)
+    pruned = CBSSolver(my_map, starts, goals, prioritize_conflicts=True, heuristic='none')
+    paths, _ = pruned.findSolution(False)
+    assert pruned.num_of_duplicates > 0
+    assert getSumOfCost(paths) == cost
+
+    unpruned = UnprunedCBSSolver(my_map, starts, goals, prioritize_conflicts=True, heuristic='none')
+    paths, _ = unpruned.findSolution(False)
+    assert getSumOfCost(paths) == cost
+
+
+def test_time_limit_of_meta_agents():
+    """ A joint search of a meta-agent aborted at the deadline is neither a solution nor a proof that there is none:
+        CBS reports the time limit instead of returning a node, and caches nothing for the aborted search
+    """
+    my_map, starts, goals = import_mapf_instance(os.path.join(CODE_DIR, 'instances', 'test_47.txt'))
+    solver = CBSSolver(my_map, starts, goals, merge_threshold=0)
+    solver.time_limit = 1
+    assert solver.findSolution(False) == ([], 0)
+    assert all(path is not None for path in solver.path_cache.paths.values())
@@ -0,0 +1,87 @@
+"""
+Tests of the low-level path cache of CBS: a cached path is only reused by the same agent under the same constraints.
+Run with python -m pytest from the code folder.
+"""
+
+import os
+from cbs import CBSSolver
+from path_cache import PathCache
+from utilities import import_mapf_instance
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class CountingPlanner(object):
+    """ Low-level planner stub which records how often it is called and returns a new path each time """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [(0, self.calls)]
+
+
+def test_identical_constraints_reuse_path():
+    """ The same constraints in another order have the same key, the path is planned once """
+    cache = PathCache()
+    planner = CountingPlanner()
+    constraints = [{'agent': 0, 'loc': [(1, 2)], 'timestep': 3},
+                   {'agent': 0, 'loc': [(1, 2), (1, 3)], 'timestep': 4}]
+    path = cache.getPath(0, constraints, planner)
+    assert cache.getPath(0, constraints[::-1], planner) is path
+    assert planner.calls == 1
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_different_constraints_replan():
+    """ A constraint with another location, timestep, polarity or type, or another agent, gives another key """
+    cache = PathCache()
+    planner = CountingPlanner()
+    constraint = {'agent': 0, 'loc': [(1, 2)], 'timestep': 3}
+    variants = [dict(constraint, loc=[(2, 2)]), dict(constraint, timestep=4), dict(constraint, positive=True),
+                dict(constraint, type='length')]
+    path = cache.getPath(0, [constraint], planner)
+    for variant in variants:
+        assert cache.getPath(0, [variant], planner) is not path
+    # a constraint set which contains the cached one is not the same key either
+    assert cache.getPath(0, [constraint, variants[0]], planner) is not path
+    assert cache.getPath(1, [constraint], planner) is not path
+    assert planner.calls == 1 + len(variants) + 2
+
+
+def test_missing_path_cached():
+    """ An agent without a path under the constraints is cached as well, it is not planned again """
+    cache = PathCache()
+    calls = []
+    plan = lambda: calls.append(1)
+    assert cache.getPath(0, [], plan) is None
+    assert cache.getPath(0, [], plan) is None
+    assert len(calls) == 1
+
+
+def test_least_recently_used_evicted():
+    """ Once the cache is full the least recently used path is evicted """
+    cache = PathCache(max_size=2)
+    planner = CountingPlanner()
+    first = cache.getPath(0, [], planner)
+    cache.getPath(1, [], planner)
+    assert cache.getPath(0, [], planner) is first
+    cache.getPath(2, [], planner)
+    assert cache.lookup(1, []) == (False, None)
+    assert cache.lookup(0, []) == (True, first)
+
+
+def test_cached_paths_match_replanned_paths():
+    """ Every path cached by CBS is a shortest path of its agent under the constraints it is cached with """
+    my_map, starts, goals = import_mapf_instance(os.path.join(CODE_DIR, 'instances', 'test_47.txt'))
+    solver = CBSSolver(my_map, starts, goals, prioritize_conflicts=True)
+    solver.findSolution(False)
+    assert solver.path_cache.hits > 0
+    for (agent, key), path in solver.path_cache.paths.items():
+        constraints = [{'agent': a, 'loc': list(loc), 'timestep': t, 'positive': positive, 'type': kind}
+                       for a, loc, t, positive, kind in key]
+        replanned = solver.planGroup((agent,), [constraints])
+        assert (path is None) == (replanned is None)
+        if path is not None:
+            assert len(path) == len(replanned)
@@ -1,11 +1,14 @@
 import argparse
 import matplotlib.pyplot as plt
 from cbs import CBSSolver
+from ecbs import ECBSSolver
 from independent import IndependentSolver
 from prioritized import PrioritizedPlanningSolver
 from pathlib import Path
 from distributed_individual import DistributedPlanningSolverIndividual
 from cbs import detectCollisions
+from heuristics import setCacheDirectory
+from independence_detection import IndependenceDetectionSolver
 
 SOLVER = "CBS"
 
@@ -54,10 +57,30 @@ def parseArgs():
                         help='Use batch output instead of animation')
     parser.add_argument('--disjoint', action='store_true', default=False,
                         help='Use the disjoint splitting')
+    parser.add_argument('--prioritize_conflicts', action='store_true', default=False,
+                        help='Split CBS and ECBS nodes on their cardinal conflicts first, then on their semi-cardinal ones (classified with MDDs)')
+    parser.add_argument('--symmetry_reasoning', action='store_true', default=False,
+                        help='Resolve the target, corridor and rectangle conflicts of CBS and ECBS in one split, with length, range and barrier constraints')
     parser.add_argument('--solver', type=str, default=SOLVER,
-                        help='The solver to use (one of: {CBS,Independent,Prioritized}), defaults to ' + str(SOLVER))
+                        help='The solver to use (one of: {CBS,ECBS,Independent,Prioritized,Distributed}), defaults to ' + str(SOLVER))
+    parser.add_argument('--suboptimality', type=float, default=1.05,
+                        help='The suboptimality factor of ECBS, defaults to 1.05')
+    parser.add_argument('--independence', action='store_true', default=False,
+                        help='Use independence detection: only the groups of agents whose paths collide are solved jointly (CBS, ECBS and Prioritized)')
     parser.add_argument('--heuristics', type=str, default='none', 
                         help='The heurisitcs used in running the distributed planner, defaults to None')
+    parser.add_argument('--low_level', type=str, default='astar',
+                        help='The low-level search used by CBS and Prioritized (one of: {astar,sipp}), defaults to astar')
+    parser.add_argument('--cbs_heuristic', type=str, default='none',
+                        help='The high-level heuristic of CBS (one of: {none,CG,DG,WDG}), defaults to none')
+    parser.add_argument('--merge_threshold', type=int, default=None,
+                        help='Merge two agents of CBS into a meta-agent once they collided more than this number of times along a branch, defaults to None (never merge)')
+    parser.add_argument('--merge_policy', type=str, default='joint',
+                        help='The low-level search of the meta-agents of CBS (one of: {joint,cbs}), defaults to joint')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes planning the children of CBS, solving the groups of independence detection, or replanning the agents of the distributed planner, in parallel, defaults to 1 (sequential)')
+    parser.add_argument('--heuristics_cache', type=str, default=None,
+                        help='Directory in which the distance fields to the goals are stored between runs, defaults to None (memory only)')
     
     args = parser.parse_args()
     return args
@@ -122,17 +145,40 @@ def import_mapf_instance(filename):
 def processArgs(args, my_map, starts, goals):
     time = 0
     paths = []
-    if args.solver == "CBS":
+    # the distance fields are shared between runs on the same map, optionally through the disk
+    setCacheDirectory(args.heuristics_cache)
+    # both levels of ECBS use its own focal search, which has no SIPP version
+    if args.solver == "ECBS" and args.low_level != "astar":
+        raise RuntimeError("ECBS does not support --low_level " + args.low_level)
+    if args.independence and args.solver in ["CBS", "ECBS", "Prioritized"]:
+        # print("***Run Independence Detection***")
+        options = {'low_level': args.low_level, 'cbs_heuristic': args.cbs_heuristic,
+                   'prioritize_conflicts': args.prioritize_conflicts, 'symmetry_reasoning': args.symmetry_reasoning,
+                   'merge_threshold': args.merge_threshold, 'merge_policy': args.merge_policy,
+                   'disjoint': args.disjoint, 'suboptimality': args.suboptimality}
+        solver = IndependenceDetectionSolver(my_map, starts, goals, args.solver, options, args.workers)
+        paths, time = solver.findSolution()
+    elif args.solver == "CBS":
         # print("***Run CBS***")
-        cbs = CBSSolver(my_map, starts, goals)
+        cbs = CBSSolver(my_map, starts, goals, args.low_level, prioritize_conflicts=args.prioritize_conflicts,
+                        heuristic=args.cbs_heuristic, symmetry_reasoning=args.symmetry_reasoning,
+                        merge_threshold=args.merge_threshold, merge_policy=args.merge_policy, workers=args.workers)
         paths, time = cbs.findSolution(args.disjoint)
+    elif args.solver == "ECBS":
+        # print("***Run ECBS***")
+        # the children of ECBS are planned one after the other, the groups of independence detection can be parallel
+        if args.workers != 1:
+            raise RuntimeError("ECBS does not support --workers, except with --independence")
+        solver = ECBSSolver(my_map, starts, goals, args.suboptimality,
+                            prioritize_conflicts=args.prioritize_conflicts, symmetry_reasoning=args.symmetry_reasoning)
+        paths, time = solver.findSolution(args.disjoint)
     elif args.solver == "Independent":
         # print("***Run Independent***")
         solver = IndependentSolver(my_map, starts, goals)
         paths, time = solver.find_solution()
     elif args.solver == "Prioritized":
         # print("***Run Prioritized***")
-        solver = PrioritizedPlanningSolver(my_map, starts, goals)
+        solver = PrioritizedPlanningSolver(my_map, starts, goals, args.low_level)
         paths, time = solver.find_solution()
     elif args.solver == "Distributed":  # Wrapper of distributed planning solver class
         # print("***Run Distributed Planning***")
@@ -140,7 +186,7 @@ def processArgs(args, my_map, starts, goals):
         if args.heuristics != "none":
             heuristics = args.heuristics.strip('][').split(',')
             heuristics = [int(x) for x in heuristics] # convert to int
-        solver = DistributedPlanningSolverIndividual(my_map, starts, goals, heuristics) #!!!TODO: add your own distributed planning implementation here.
+        solver = DistributedPlanningSolverIndividual(my_map, starts, goals, heuristics, args.workers) #!!!TODO: add your own distributed planning implementation here.
         paths, time = solver.findSolution()
     else: 
         raise RuntimeError("Unknown solver!")